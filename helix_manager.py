@@ -28,17 +28,21 @@ import os                 # For path manipulation (finding files, creating dirs,
 import re                 # For regular expressions used in config file parsing.
 import importlib.util     # For checking if a library is installed without importing it.
 import threading          # For running the HTTPS server and WSS logger concurrently.
+import queue              # For handing WSS log output from the pipe reader to the console writer thread.
+import select             # For waiting on a process file descriptor (pidfd) during shutdown on Linux.
 import time               # For pausing execution (e.g., in wait loops).
-import ssl                # For setting up the SSL context for the HTTPS server.
-import http.server        # For the basic HTTPS file server implementation.
-import logging            # For logging HTTPS server activity to a file.
+# Note: ssl, http.server, socketserver and logging are imported lazily when the HTTPS server
+# is first started (see _setup_https_logging and _https_server_classes), keeping startup cheap.
 import platform           # For detecting the operating system (Windows, Linux, Darwin).
 import shutil             # For finding executables in PATH (shutil.which).
-from socketserver import ThreadingMixIn # To make the HTTPS server handle requests in threads.
+import atexit             # For flushing buffered log output when the manager exits.
+import io                 # For io.UnsupportedOperation (in-memory responses such as directory listings).
 from functools import partial # Used for creating the HTTPS request handler with directory
+from functools import lru_cache # For memoizing expensive lookups (package probes, executable paths).
 
 # --- Constants ---
 # Define file paths relative to the location of this script for portability.
+SYSTEM_NAME = platform.system() # Detected OS (Windows, Linux, Darwin), resolved once at startup.
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__)) # Absolute path to script's directory.
 # Path to the WSS server configuration file.
 CONFIG_FILE_PATH = os.path.join(SCRIPT_DIR, 'server', 'config.py') # Path to server config file.
@@ -47,37 +51,111 @@ CLIENT_CONFIG_FILE_PATH = os.path.join(SCRIPT_DIR, 'client', 'js', 'config.js')
 # Path to the server requirements file.
 REQUIREMENTS_FILE_PATH = os.path.join(SCRIPT_DIR, 'server', 'requirements.txt')
 HTTPS_CLIENT_DIR = os.path.join(SCRIPT_DIR, 'client') # Path to the client files directory.
+WSS_SCRIPT_PATH = os.path.join(SCRIPT_DIR, 'server', 'main.py') # Entry point of the WSS server.
+WSS_COMMAND = (sys.executable, WSS_SCRIPT_PATH) # Runs the WSS server with the same Python interpreter.
 CERT_DIR = os.path.join(SCRIPT_DIR, 'certs') # Path to the SSL certificates directory.
-CERT_FILE = os.path.join(CERT_DIR, 'cert.pem') # Expected SSL certificate filename.
-KEY_FILE = os.path.join(CERT_DIR, 'key.pem') # Expected SSL private key filename.
+CERT_FILE_NAME = 'cert.pem' # Expected SSL certificate filename.
+KEY_FILE_NAME = 'key.pem' # Expected SSL private key filename.
+CERT_FILE = os.path.join(CERT_DIR, CERT_FILE_NAME) # Path to the SSL certificate.
+KEY_FILE = os.path.join(CERT_DIR, KEY_FILE_NAME) # Path to the SSL private key.
 CERT_OLD_FILE = os.path.join(CERT_DIR, 'cert_old.pem') # Backup certificate filename.
 KEY_OLD_FILE = os.path.join(CERT_DIR, 'key_old.pem') # Backup key filename.
+CERT_MIN_VALID_DAYS = 7 # Existing certificates valid for at least this many more days are reused as-is.
+CERT_REQUIRED_SANS = {('DNS', 'localhost'), ('IP Address', '127.0.0.1')} # Names the certificate must cover.
 LOG_DIR = os.path.join(SCRIPT_DIR, 'logs') # Directory to store log files.
 HTTPS_LOG_FILE = os.path.join(LOG_DIR, 'https_server.log') # Log file for the HTTPS server.
-
-# --- Global Variables for Server Management ---
-# These variables hold references to the running processes and threads
-# to allow for proper management and shutdown.
-wss_process = None      # Holds the subprocess.Popen object for the WSS server.
-https_server = None     # Holds the http.server.HTTPServer instance.
-https_thread = None     # Holds the threading.Thread object for the HTTPS server.
-wss_log_thread = None   # Holds the threading.Thread object for the WSS logger.
-stop_event = threading.Event() # A synchronization primitive used to signal threads (like the WSS logger) to stop gracefully.
+CONFIG_IO_BUFFER_SIZE = 128 * 1024 # Buffer size for config file I/O, so a whole file is read/written in one call.
+HTTPS_LOG_BUFFER_SIZE = 64 * 1024 # Buffer size for the HTTPS log file; coalesces many small per-request writes.
+HTTPS_COPY_BUFFER_SIZE = 1024 * 1024 # Chunk size when streaming static files too large for the in-memory cache.
+HTTPS_CACHE_MAX_FILE_SIZE = 256 * 1024 # Static files up to this size are kept in memory after the first request.
+HTTPS_CACHE_MAX_FILES = 32 # Cached static files; with the size cap this bounds the cache at 8 MiB (client bundle is ~17 files).
+WSS_LOG_READ_SIZE = 64 * 1024 # Maximum bytes pulled from the WSS stdout pipe per read.
+WSS_LOG_QUEUE_SIZE = 4096 # Maximum WSS log blocks waiting for the console writer; further output is dropped.
+WSS_LOG_WRITE_BATCH = 64 # Maximum queued WSS log blocks written to the console in one write.
+
+# Fixed subprocess.Popen() arguments for the WSS server process, built once.
+WSS_POPEN_KWARGS = {
+    'stdout': subprocess.PIPE, # Capture standard output.
+    'stderr': subprocess.STDOUT, # Redirect standard error to standard output.
+    'bufsize': 0, # Unbuffered binary pipe; the log thread reads the raw descriptor and decodes lines itself.
+    'env': {**os.environ, 'PYTHONIOENCODING': 'utf-8'}, # Child writes UTF-8, matching how the log thread decodes.
+    'cwd': SCRIPT_DIR, # Set working directory to script's directory.
+}
+
+# --- Precompiled Config Patterns ---
+# Compiled once at import so config parsing/rewriting never pays the regex compile (or cache lookup) cost.
+# Patterns for reading values from the full server/config.py content.
+CONFIG_HOST_REGEX = re.compile(r"^HOST\s*=\s*['\"]([^'\"]+)['\"]", re.MULTILINE)
+CONFIG_PORT_REGEX = re.compile(r"^PORT\s*=\s*(\d+)", re.MULTILINE)
+CONFIG_DEBUG_REGEX = re.compile(r"^DEBUG\s*=\s*(True|False)", re.MULTILINE)
+# Patterns matching whole setting lines, used to substitute new values when rewriting server/config.py.
+CONFIG_HOST_LINE_REGEX = re.compile(r"^HOST\s*=.*$", re.MULTILINE)
+CONFIG_PORT_LINE_REGEX = re.compile(r"^PORT\s*=.*$", re.MULTILINE)
+CONFIG_DEBUG_LINE_REGEX = re.compile(r"^DEBUG\s*=.*$", re.MULTILINE)
+
+# --- Server Management State ---
+class ManagerState:
+    """
+    References to the running processes, threads and events of one start_servers() session,
+    passed explicitly to the server management helpers to allow for proper management and shutdown.
+    """
+    __slots__ = ('wss_process', 'https_server', 'https_thread', 'wss_log_thread', 'wss_writer_thread',
+                 'stop_event', 'monitor_event') # Fixed attribute set; no per-instance __dict__.
+
+    def __init__(self):
+        self.wss_process = None       # Holds the subprocess.Popen object for the WSS server.
+        self.https_server = None      # Holds the http.server.HTTPServer instance.
+        self.https_thread = None      # Holds the threading.Thread object for the HTTPS server.
+        self.wss_log_thread = None    # Holds the threading.Thread object for the WSS logger.
+        self.wss_writer_thread = None # Holds the threading.Thread object writing WSS log output to the console.
+        self.stop_event = threading.Event() # Signals threads (like the WSS logger) to stop gracefully.
+        self.monitor_event = threading.Event() # Set when a server exits, waking the monitor loop in start_servers immediately.
+
+# --- Cached Config Content ---
+# Text of server/config.py as last read by read_config() or written by write_config(),
+# so saving settings does not need to re-read the file. None means it has not been read yet.
+server_config_content = None
+# Modification time (st_mtime_ns) of server/config.py when server_config_content was taken. write_config()
+# only reuses the cached text if the file still has this mtime, so external edits are not reverted.
+server_config_mtime_ns = None
 
 # --- Logging Setup for HTTPS Server ---
-# Configure a dedicated logger for the HTTPS server to write to a file.
-https_logger = logging.getLogger('HTTPServer') # Get a specific logger instance.
-https_logger.setLevel(logging.INFO) # Set the minimum logging level.
-# Ensure the log directory exists before trying to write to it.
-os.makedirs(LOG_DIR, exist_ok=True)
-# Create a file handler to write logs to the specified file in append mode ('a').
-https_file_handler = logging.FileHandler(HTTPS_LOG_FILE, mode='a', encoding='utf-8')
-# Define the format for log messages written to the file.
-https_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-# Add the file handler to our dedicated logger.
-https_logger.addHandler(https_file_handler)
-# Prevent messages logged here from propagating up to the root logger (which might log to console).
-https_logger.propagate = False
+# The dedicated HTTPS logger is configured on first use by _setup_https_logging().
+https_logger = None       # Logger writing HTTPS server activity to HTTPS_LOG_FILE.
+https_file_handler = None # Buffered handler backing https_logger.
+
+def _setup_https_logging():
+    """
+    Configures the dedicated HTTPS server file logger on first call; later calls do nothing.
+    Deferred so the logging module and the log file are only touched when the HTTPS server runs.
+    """
+    global https_logger, https_file_handler
+    if https_logger is not None: return
+    import logging
+
+    class BufferedStreamHandler(logging.StreamHandler):
+        """StreamHandler that does not flush after every record; flushing is left to the stream buffer or explicit flush() calls."""
+        def emit(self, record):
+            try: self.stream.write(self.format(record) + self.terminator)
+            except Exception: self.handleError(record)
+
+    # Configure a dedicated logger for the HTTPS server to write to a file.
+    logger = logging.getLogger('HTTPServer') # Get a specific logger instance.
+    logger.setLevel(logging.INFO) # Set the minimum logging level.
+    # Ensure the log directory exists before trying to write to it.
+    os.makedirs(LOG_DIR, exist_ok=True)
+    # Open the log file in append mode ('a') with an explicit buffer so per-request records are batched into few writes.
+    https_log_stream = open(HTTPS_LOG_FILE, 'a', encoding='utf-8', buffering=HTTPS_LOG_BUFFER_SIZE)
+    https_file_handler = BufferedStreamHandler(https_log_stream)
+    # Make sure buffered records reach the file when the manager exits.
+    atexit.register(https_file_handler.flush)
+    # Define the format for log messages written to the file.
+    https_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    # Add the file handler to our dedicated logger.
+    logger.addHandler(https_file_handler)
+    # Prevent messages logged here from propagating up to the root logger (which might log to console).
+    logger.propagate = False
+    https_logger = logger
 
 # --- Dependency Management ---
 def parse_package_name(requirement_line):
@@ -102,6 +180,24 @@ def parse_package_name(requirement_line):
         return match.group(0)
     return None # Return None if no valid package name start is found
 
+@lru_cache(maxsize=None)
+def is_package_installed(package_name):
+    """
+    Checks whether a package is importable, caching the result per package name.
+    Skips the sys.path finder walk entirely if the package is already imported.
+
+    Args:
+        package_name (str): The top-level package name (e.g., 'websockets').
+
+    Returns:
+        bool: True if the package is already imported or can be found, False otherwise.
+    """
+    # Already imported modules need no filesystem probing at all.
+    if package_name in sys.modules:
+        return True
+    # Use find_spec for a lightweight check without importing.
+    return importlib.util.find_spec(package_name) is not None
+
 def check_dependencies():
     """
     Checks if Python packages listed in server/requirements.txt are installed.
@@ -119,9 +215,8 @@ def check_dependencies():
         for line in requirements:
             package_name = parse_package_name(line)
             if package_name:
-                # Use find_spec for a lightweight check without importing.
-                spec = importlib.util.find_spec(package_name)
-                if spec is None:
+                # Cached probe; avoids re-walking sys.path finders on repeat checks.
+                if not is_package_installed(package_name):
                     print(f"  - Package '{package_name}' not found.")
                     missing_packages.append(package_name)
                 # else: # Removed the debug logging for found packages here
@@ -138,16 +233,19 @@ def check_dependencies():
                     # Run pip install -r using the current Python interpreter.
                     subprocess.run(
                         [sys.executable, "-m", "pip", "install", "-r", REQUIREMENTS_FILE_PATH],
-                        check=True,        # Raise error if pip fails
-                        capture_output=True,# Hide pip output unless error
-                        text=True          # Decode output as text
+                        check=True,               # Raise error if pip fails
+                        stdout=subprocess.DEVNULL, # Discard pip's progress output
+                        stderr=subprocess.PIPE     # Keep stderr (raw bytes) to show if pip fails
                     )
                     print("Packages installed successfully.")
+                    # Drop cached negative results so later checks see the new packages.
+                    is_package_installed.cache_clear()
+                    importlib.invalidate_caches()
                 except subprocess.CalledProcessError as e:
                     # Handle pip installation errors.
                     print(f"Error installing packages: {e}")
                     print("--- PIP Error Output ---")
-                    print(e.stderr) # Print captured stderr
+                    print(e.stderr.decode('utf-8', 'replace') if e.stderr else '') # Decode captured stderr only on failure
                     print("----------------------")
                     print(f"Please install packages manually (e.g., 'pip install -r {REQUIREMENTS_FILE_PATH}') and restart.")
                     sys.exit(1) # Exit manager script.
@@ -173,6 +271,107 @@ def check_dependencies():
 
 
 # --- Certificate Generation ---
+def _cert_dir_names():
+    """
+    Lists the entry names in the certificates directory with a single directory read,
+    so several existence checks can be answered without one stat call each.
+
+    Returns:
+        set: Names of the entries in CERT_DIR (empty if the directory does not exist).
+    """
+    try:
+        with os.scandir(CERT_DIR) as entries: return {entry.name for entry in entries}
+    except FileNotFoundError: return set()
+
+def _certs_present(names=None):
+    """
+    Checks that both the certificate and key files exist.
+
+    Args:
+        names (set, optional): Result of a previous _cert_dir_names() call to reuse.
+                               The directory is scanned if not provided.
+
+    Returns:
+        bool: True if both CERT_FILE and KEY_FILE exist, False otherwise.
+    """
+    if names is None: names = _cert_dir_names()
+    return CERT_FILE_NAME in names and KEY_FILE_NAME in names
+
+@lru_cache(maxsize=4)
+def _decode_cert(cert_path, mtime_ns):
+    """
+    Parses a PEM certificate into a dict (as returned by SSLSocket.getpeercert()).
+    Cached per (path, modification time), so an unchanged file is only parsed once.
+
+    Args:
+        cert_path (str): Path to the PEM certificate.
+        mtime_ns (int): The file's modification time; part of the cache key only.
+
+    Returns:
+        dict or None: The decoded certificate fields ('notAfter', 'subjectAltName', ...),
+                      or None if the certificate cannot be decoded on this Python.
+    """
+    import ssl
+    # Note: _ssl._test_decode_cert is a private CPython test hook (no public API parses a PEM file into
+    # this dict) with no compatibility guarantee. If it is missing, or decoding fails, report None so the
+    # caller treats the certificate as not fresh and falls back to regenerating it.
+    decode = getattr(ssl._ssl, '_test_decode_cert', None)
+    if decode is None: return None
+    try: return decode(cert_path)
+    except (ssl.SSLError, OSError, ValueError): return None
+
+def _cert_is_fresh():
+    """
+    Checks whether the existing certificate can be reused without running mkcert again:
+    it must cover localhost/127.0.0.1 and stay valid for at least CERT_MIN_VALID_DAYS.
+
+    Returns:
+        bool: True if the certificate is usable, False if it is missing, unreadable, or expiring.
+    """
+    try:
+        import ssl
+        cert = _decode_cert(CERT_FILE, os.stat(CERT_FILE).st_mtime_ns)
+        if cert is None: return False # Could not decode: regenerate.
+        covers_local = CERT_REQUIRED_SANS <= set(cert.get('subjectAltName', ()))
+        remaining_seconds = ssl.cert_time_to_seconds(cert['notAfter']) - time.time()
+        return covers_local and remaining_seconds > CERT_MIN_VALID_DAYS * 86400
+    except Exception: return False
+
+@lru_cache(maxsize=1)
+def _find_mkcert(system):
+    """
+    Locates the mkcert executable: in PATH, or on Windows also as certs/mkcert.exe.
+    Cached so repeat visits to the certificate menu skip the PATH walk; callers clear
+    the cache when the lookup fails.
+
+    Args:
+        system (str): The detected OS name ('Windows', 'Linux', 'Darwin').
+
+    Returns:
+        str or None: Path to mkcert, or None if it was not found.
+    """
+    mkcert_path = shutil.which("mkcert")
+    if mkcert_path is None and system == "Windows":
+        expected_path = os.path.join(CERT_DIR, "mkcert.exe")
+        if os.path.exists(expected_path): mkcert_path = expected_path
+    return mkcert_path
+
+@lru_cache(maxsize=1)
+def _mkcert_version(mkcert_path):
+    """
+    Runs 'mkcert -version' once per manager process for a given executable path.
+    Failures raise and are therefore not cached, so a later call retries.
+
+    Args:
+        mkcert_path (str): Path to the mkcert executable.
+
+    Returns:
+        str: The version information printed by mkcert.
+    """
+    # Only stdout carries the version; stderr is not needed.
+    result = subprocess.run([mkcert_path, "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True, timeout=10)
+    return result.stdout.strip()
+
 def generate_certificates():
     """
     Manages TLS certificate generation using mkcert.
@@ -185,33 +384,24 @@ def generate_certificates():
     os.makedirs(CERT_DIR, exist_ok=True) # Ensure certs directory exists
 
     # 1. Find mkcert executable
-    mkcert_path = None
-    system = platform.system()
+    system = SYSTEM_NAME
     print(f"Detected OS: {system}")
-    if system == "Windows":
-        mkcert_path = shutil.which("mkcert")
-        if not mkcert_path:
-            expected_path = os.path.join(CERT_DIR, "mkcert.exe")
-            if os.path.exists(expected_path): mkcert_path = expected_path
-            else:
-                 print(f"Error: 'mkcert.exe' not found in PATH or '{CERT_DIR}'. Install or place it correctly.")
-                 return False
-        print(f"Found mkcert at: {mkcert_path}")
-    elif system in ["Linux", "Darwin"]:
-        mkcert_path = shutil.which("mkcert")
-        if mkcert_path is None:
-            print("Error: 'mkcert' command not found in your system PATH. Please install it.")
-            return False
-        print(f"Found mkcert in PATH: {mkcert_path}")
-    else:
+    if system not in ["Windows", "Linux", "Darwin"]:
         print(f"Unsupported OS for mkcert handling: {system}")
         return False
+    mkcert_path = _find_mkcert(system) # Cached after the first successful lookup.
+    if mkcert_path is None:
+        _find_mkcert.cache_clear() # Don't remember a failed lookup; mkcert may be installed before the next try.
+        if system == "Windows": print(f"Error: 'mkcert.exe' not found in PATH or '{CERT_DIR}'. Install or place it correctly.")
+        else: print("Error: 'mkcert' command not found in your system PATH. Please install it.")
+        return False
+    if system == "Windows": print(f"Found mkcert at: {mkcert_path}")
+    else: print(f"Found mkcert in PATH: {mkcert_path}")
 
     # 2. Display mkcert version
     try:
         print("Checking mkcert version...")
-        result = subprocess.run([mkcert_path, "-version"], capture_output=True, text=True, check=True, timeout=10)
-        print(f"mkcert version info:\n{result.stdout.strip()}")
+        print(f"mkcert version info:\n{_mkcert_version(mkcert_path)}") # Cached after the first successful run.
     except Exception as e: print(f"Warning: Could not get mkcert version: {e}")
 
     # 3. Offer to install CA
@@ -224,18 +414,26 @@ def generate_certificates():
         except Exception as e: print(f"Warning: 'mkcert -install' command failed: {e}")
 
     # 4. Check for existing certificates and handle overwrite/backup
-    certs_exist = os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE)
+    cert_dir_names = _cert_dir_names() # One directory scan answers all existence checks below.
+    certs_exist = _certs_present(cert_dir_names)
     generate_new = True
-    if certs_exist:
+    if certs_exist and _cert_is_fresh():
+        # Valid certificates usually need no regeneration, so default to skipping the mkcert run.
+        # The freshness check does not look at the issuer, though (e.g. a cert from a CA that is not
+        # installed/trusted), so still let the user force a new one.
+        print(f"\nExisting certificates cover localhost/127.0.0.1 and are valid for at least {CERT_MIN_VALID_DAYS} more days.")
+        overwrite = input("Regenerate anyway (e.g. after installing a new mkcert CA)? (y/N): ").lower().strip()
+    elif certs_exist:
         print(f"\nExisting certificate files found:\n  {CERT_FILE}\n  {KEY_FILE}")
         overwrite = input("Overwrite existing certificates? (y/n): ").lower().strip()
+    if certs_exist: # Both prompts above lead to the same backup / keep handling.
         if overwrite == 'y':
             backup = input("Backup existing files to cert_old.pem/key_old.pem? (y/n): ").lower().strip()
             if backup == 'y':
                 try:
                     print("Backing up existing certificates...")
-                    if os.path.exists(CERT_FILE): os.replace(CERT_FILE, CERT_OLD_FILE)
-                    if os.path.exists(KEY_FILE): os.replace(KEY_FILE, KEY_OLD_FILE)
+                    if CERT_FILE_NAME in cert_dir_names: os.replace(CERT_FILE, CERT_OLD_FILE)
+                    if KEY_FILE_NAME in cert_dir_names: os.replace(KEY_FILE, KEY_OLD_FILE)
                     print(f"Backup complete: {CERT_OLD_FILE}, {KEY_OLD_FILE}")
                 except OSError as e: print(f"Warning: Failed to back up existing certificates: {e}")
             else: print("Skipping backup.")
@@ -253,7 +451,7 @@ def generate_certificates():
             print("mkcert generation command executed.")
             if result.stdout: print(f"mkcert output:\n{result.stdout.strip()}")
             if result.stderr: print(f"mkcert error output:\n{result.stderr.strip()}")
-            if not (os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE)):
+            if not _certs_present():
                 print("Error: mkcert command seemed to succeed but output files are missing!")
                 return False
             print("New certificate and key files generated successfully.")
@@ -263,7 +461,7 @@ def generate_certificates():
             return False
 
     # 6. Final check and return status
-    if os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE):
+    if _certs_present():
         print("Certificate check passed.")
         return True
     else:
@@ -271,6 +469,25 @@ def generate_certificates():
         return False
 
 # --- Configuration Management ---
+def _write_file_atomic(path, content):
+    """
+    Writes text to a temporary file next to 'path' and then atomically replaces 'path' with it,
+    so a crash mid-write can never leave a truncated or half-written config file behind.
+
+    Args:
+        path (str): The file to (over)write.
+        content (str): The complete new file content.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', buffering=CONFIG_IO_BUFFER_SIZE) as f: f.write(content)
+        os.replace(tmp_path, path) # Atomic on POSIX and Windows.
+    except BaseException:
+        # Don't leave the temporary file behind if writing or replacing failed.
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
 def read_config():
     """
     Reads WSS settings (HOST, PORT, DEBUG) from server/config.py and
@@ -283,6 +500,7 @@ def read_config():
               {'wss_host', 'wss_port', 'https_host', 'https_port',
                'server_debug', 'client_debug'}.
     """
+    global server_config_content, server_config_mtime_ns # Cache of server/config.py, reused by write_config().
     # Initialize settings with default values.
     settings = {
         'wss_host': '0.0.0.0',
@@ -330,17 +548,19 @@ def read_config():
     # Read server config, but WSS Port from client config takes precedence if found
     try:
         # print(f"Reading WSS configuration from: {server_config_path}") # Silent read
-        with open(server_config_path, 'r', encoding='utf-8') as f:
+        with open(server_config_path, 'r', encoding='utf-8', buffering=CONFIG_IO_BUFFER_SIZE) as f:
             content = f.read()
+            # Keep for write_config(), together with the mtime the text belongs to.
+            server_config_content, server_config_mtime_ns = content, os.fstat(f.fileno()).st_mtime_ns
 
             # WSS Host
-            wss_host_match = re.search(r"^HOST\s*=\s*['\"]([^'\"]+)['\"]", content, re.MULTILINE)
+            wss_host_match = CONFIG_HOST_REGEX.search(content)
             if wss_host_match: settings['wss_host'] = wss_host_match.group(1)
             else: print(f"Warning: Could not find WSS HOST setting in {server_config_path}, using default '{settings['wss_host']}'.")
 
             # WSS Port (Only use if not found in client config)
             if wss_port_from_client is None:
-                wss_port_match = re.search(r"^PORT\s*=\s*(\d+)", content, re.MULTILINE)
+                wss_port_match = CONFIG_PORT_REGEX.search(content)
                 if wss_port_match:
                     try:
                         settings['wss_port'] = int(wss_port_match.group(1))
@@ -349,7 +569,7 @@ def read_config():
                 else: print(f"Warning: Could not find WSS PORT setting in {server_config_path}, using default {settings['wss_port']}.")
 
             # Server Debug
-            server_debug_match = re.search(r"^DEBUG\s*=\s*(True|False)", content, re.MULTILINE)
+            server_debug_match = CONFIG_DEBUG_REGEX.search(content)
             if server_debug_match:
                 # Convert Python boolean string to actual boolean
                 settings['server_debug'] = server_debug_match.group(1) == 'True'
@@ -364,7 +584,7 @@ def read_config():
 def write_config(settings):
     """
     Writes the WSS settings (HOST, PORT, DEBUG) back to the server/config.py file silently.
-    Reads existing file, modifies relevant lines, preserves others, and overwrites.
+    Uses the content cached by read_config() (reading the file only if needed), substitutes the first line of each setting, preserves others, and overwrites.
     Appends settings if not found. Creates file if it doesn't exist.
     Uses repr() for string/boolean values to ensure proper Python syntax.
     Does NOT write HTTPS settings or Client settings to this file.
@@ -376,62 +596,50 @@ def write_config(settings):
     Returns:
         bool: True if writing was successful, False otherwise.
     """
+    global server_config_content, server_config_mtime_ns
     config_file_path = CONFIG_FILE_PATH
     try:
         # print(f"Attempting to update Server configuration in: {config_file_path}") # Silent write
-        lines = []
-        try:
-            # Read existing lines from the config file.
-            with open(config_file_path, 'r', encoding='utf-8') as f: lines = f.readlines()
-        except FileNotFoundError: pass # Silently proceed if file not found
-
-        new_lines = [] # List to hold the modified lines.
-        # Flags to track if WSS settings were found and updated.
-        updated_flags = {'wss_host': False, 'wss_port': False, 'server_debug': False}
+        # Reuse the content read at startup, unless the file has not been read yet or was changed since
+        # (e.g., edited by hand while the manager was running); then read it again so those edits are kept.
+        try: current_mtime_ns = os.stat(config_file_path).st_mtime_ns
+        except FileNotFoundError: current_mtime_ns = None
+        content = server_config_content
+        if content is None or current_mtime_ns != server_config_mtime_ns:
+            content = ''
+            try:
+                # Read the existing config file content in one call.
+                with open(config_file_path, 'r', encoding='utf-8', buffering=CONFIG_IO_BUFFER_SIZE) as f: content = f.read()
+            except FileNotFoundError: pass # Silently proceed if file not found
 
-        # Define regex patterns and corresponding setting keys and format strings for WSS/Server Debug.
-        # Use repr() for string and boolean values.
+        # Define whole-line regex patterns and corresponding setting keys and format strings for WSS/Server Debug.
         setting_patterns = {
-            re.compile(r"^HOST\s*="): ('wss_host', "HOST = {value}\n"),
-            re.compile(r"^PORT\s*="): ('wss_port', "PORT = {value}\n"),
-            re.compile(r"^DEBUG\s*="): ('server_debug', "DEBUG = {value}\n"), # Match DEBUG = True/False
+            CONFIG_HOST_LINE_REGEX: ('wss_host', "HOST = {value}"),
+            CONFIG_PORT_LINE_REGEX: ('wss_port', "PORT = {value}"),
+            CONFIG_DEBUG_LINE_REGEX: ('server_debug', "DEBUG = {value}"), # Match DEBUG = True/False
         }
 
-        # Iterate through the existing lines of the config file.
-        for line in lines:
-            line_updated = False
-            # Check if the current line matches any of the setting patterns.
-            for pattern, (key, format_str) in setting_patterns.items():
-                # If a pattern matches and this setting hasn't been updated yet...
-                if pattern.match(line) and not updated_flags[key]:
-                    # Format the new value. Use repr() for strings and booleans.
-                    value_to_write = repr(settings[key]) if isinstance(settings[key], (str, bool)) else settings[key]
-                    # Append the updated line to the new_lines list.
-                    new_lines.append(format_str.format(value=value_to_write))
-                    # Mark this setting as updated and break the inner loop.
-                    updated_flags[key], line_updated = True, True
-                    break
-            # If the line didn't match any setting pattern, append it unchanged.
-            if not line_updated: new_lines.append(line)
-
-        # Check for any settings that were not found in the existing file.
-        appended_header = False
+        missing_lines = [] # Setting lines not found in the existing file.
         for pattern, (key, format_str) in setting_patterns.items():
-            if not updated_flags[key]:
-                # Add a header comment if this is the first setting being appended.
-                if not appended_header:
-                    # Ensure there's a newline before the header if needed.
-                    if new_lines and not new_lines[-1].endswith('\n'): new_lines.append('\n')
-                    new_lines.append("\n# --- Settings added/updated by helix_manager ---\n")
-                    appended_header = True
-                # print(f"Warning: {key.upper()} line not found in config, appending.") # Silent write
-                # Format the value using repr() for strings/booleans.
-                value_to_write = repr(settings[key]) if isinstance(settings[key], (str, bool)) else settings[key]
-                # Append the new setting line.
-                new_lines.append(format_str.format(value=value_to_write))
-
-        # Write the potentially modified lines back to the config file, overwriting it.
-        with open(config_file_path, 'w', encoding='utf-8') as f: f.writelines(new_lines)
+            # Format the new value. Use repr() for strings and booleans.
+            value_to_write = repr(settings[key]) if isinstance(settings[key], (str, bool)) else settings[key]
+            new_line = format_str.format(value=value_to_write)
+            # Replace only the first matching line, in a single pass over the whole content.
+            # A function replacement avoids backslash escapes in the value being interpreted.
+            content, replaced = pattern.subn(lambda _match, line=new_line: line, content, count=1)
+            # print(f"Warning: {key.upper()} line not found in config, appending.") # Silent write
+            if not replaced: missing_lines.append(new_line + '\n')
+
+        # Append any settings that were not found in the existing file under a header comment.
+        if missing_lines:
+            # Ensure there's a newline before the header if needed.
+            if content and not content.endswith('\n'): content += '\n'
+            content += "\n# --- Settings added/updated by helix_manager ---\n" + ''.join(missing_lines)
+
+        # Write the updated content in a single call and atomically replace the config file with it.
+        _write_file_atomic(config_file_path, content)
+        # The file now holds exactly this content.
+        server_config_content, server_config_mtime_ns = content, os.stat(config_file_path).st_mtime_ns
         # print(f"Server Configuration updated successfully in {config_file_path}.") # Silent write
         return True
     except Exception as e:
@@ -538,8 +746,8 @@ def write_client_config(settings):
                 # Append the new setting line using the standard format.
                 new_lines.append(format_str.format(value=value_to_write))
 
-        # Write the potentially modified lines back to the config file.
-        with open(config_file_path, 'w', encoding='utf-8') as f: f.writelines(new_lines)
+        # Write the potentially modified lines back to the config file, replacing it atomically.
+        _write_file_atomic(config_file_path, ''.join(new_lines))
         # print(f"Client Configuration updated successfully in {config_file_path}.") # Silent write
         return True
     except Exception as e:
@@ -562,22 +770,24 @@ def config_menu(settings):
         bool: True if servers should start, False if exiting.
     """
     while True:
-        print("\n--- HeliX Configuration & Management ---")
-        print(f"1. WSS Host:         {settings['wss_host']}")
-        # MODIFIED: Clarify WSS Port affects both server and client
-        print(f"2. WSS Port:         {settings['wss_port']}")
-        print(f"3. HTTPS Host:       {settings['https_host']}")
-        print(f"4. HTTPS Port:       {settings['https_port']}")
         # Display Debug Modes
         server_debug_status = "ENABLED" if settings['server_debug'] else "DISABLED"
         client_debug_status = "ENABLED" if settings['client_debug'] else "DISABLED"
-        print(f"5. Server Debug Log: {server_debug_status}")
-        print(f"6. Client Debug Log: {client_debug_status}")
-        print("------------------------------------")
-        print("7. Manage TLS Certificates (Check/Generate/Install CA)")
-        print("8. Start HTTPS/WSS Servers")
-        print("9. Exit")
-        print("------------------------------------")
+        # Build the whole menu as one string and emit it with a single write instead of one print per line.
+        sys.stdout.write(
+            "\n--- HeliX Configuration & Management ---\n"
+            f"1. WSS Host:         {settings['wss_host']}\n"
+            f"2. WSS Port:         {settings['wss_port']}\n" # WSS Port affects both server and client
+            f"3. HTTPS Host:       {settings['https_host']}\n"
+            f"4. HTTPS Port:       {settings['https_port']}\n"
+            f"5. Server Debug Log: {server_debug_status}\n"
+            f"6. Client Debug Log: {client_debug_status}\n"
+            "------------------------------------\n"
+            "7. Manage TLS Certificates (Check/Generate/Install CA)\n"
+            "8. Start HTTPS/WSS Servers\n"
+            "9. Exit\n"
+            "------------------------------------\n"
+        )
         choice = input("Enter choice: ").strip()
 
         if choice == '1':
@@ -618,7 +828,7 @@ def config_menu(settings):
             input("Press Enter to return...")
             continue
         elif choice == '8': # Start Servers (Save Config First)
-            if not (os.path.exists(CERT_FILE) and os.path.exists(KEY_FILE)):
+            if not _certs_present():
                 print("\nError: Certificate files missing. Use option 7 first.")
                 input("Press Enter to return...")
                 continue
@@ -638,35 +848,116 @@ def config_menu(settings):
         else: print("Invalid choice.")
 
 # --- HTTPS Server Implementation ---
-class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    """Custom HTTP handler logging to file via https_logger."""
-    def __init__(self, *args, directory=None, **kwargs):
-        # Ensure directory is set correctly before calling super().__init__
-        if directory is None: directory = os.getcwd()
-        # Use functools.partial to pass the directory to the handler
-        super().__init__(*args, directory=directory, **kwargs)
-    def log_message(self, format, *args): https_logger.info("%s - %s" % (self.address_string(), format % args))
-    def log_error(self, format, *args): https_logger.error("%s - %s" % (self.address_string(), format % args))
-
-class ThreadingHTTPServer(ThreadingMixIn, http.server.HTTPServer):
-    """HTTPServer using threads."""
-    allow_reuse_address = True
-
-def _start_https_server_thread(host, port, client_dir):
-    """Internal helper to start the HTTPS server thread."""
-    global https_server, https_thread
+# In-memory cache of small client files, keyed by (device, inode, modification time, size) of the open file.
+# Filled and evicted (oldest first, at HTTPS_CACHE_MAX_FILES entries) under the lock, as requests run in threads.
+static_file_cache = {}
+static_file_cache_lock = threading.Lock()
+
+def _read_static_file(source, st):
+    """
+    Returns the content of an already-open client file, from memory when possible.
+    Client files (HTML/JS/CSS/audio) rarely change, so repeat requests skip the disk read;
+    an edited or replaced file has a new inode/mtime/size and gets a new cache key.
+    The bytes always come from 'source' itself (never reopened by path), so they belong to
+    the same file that 'st' describes and that send_head() took the Content-Length from.
+
+    Args:
+        source (file): The file object opened by send_head().
+        st (os.stat_result): os.fstat() of 'source'.
+
+    Returns:
+        bytes: The file content.
+    """
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    content = static_file_cache.get(key)
+    if content is not None: return content
+    source.seek(0)
+    content = source.read()
+    # Only cache a complete read; a file modified in place while being read is served but not remembered.
+    if len(content) != st.st_size: return content
+    with static_file_cache_lock:
+        if len(static_file_cache) >= HTTPS_CACHE_MAX_FILES:
+            static_file_cache.pop(next(iter(static_file_cache))) # Dicts keep insertion order: drop the oldest.
+        static_file_cache[key] = content
+    return content
+
+@lru_cache(maxsize=None)
+def _https_server_classes():
+    """
+    Imports the HTTP server modules and builds the HTTPS handler/server classes on first use.
+    http.server pulls in email/mimetypes etc., so this is deferred until the HTTPS server starts.
+
+    Returns:
+        tuple: (QuietHTTPRequestHandler, ThreadingHTTPServer) classes.
+    """
+    import http.server
+
+    class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+        """
+        Custom HTTP handler logging to file via https_logger.
+        The served directory is always passed in via functools.partial(..., directory=...),
+        so files are resolved against it directly and the process CWD is never changed or consulted.
+        """
+        disable_nagle_algorithm = True # Set TCP_NODELAY on each connection so small responses go out immediately.
+        # Log the bare client IP; never resolve a hostname (blocking DNS) on the request path.
+        def address_string(self): return self.client_address[0]
+        def copyfile(self, source, outputfile):
+            """Sends a static file from the in-memory cache when small enough, otherwise streams it in large chunks."""
+            try:
+                st = os.fstat(source.fileno()) # send_head() already opened the file; fstat does not touch the path again.
+            except (AttributeError, io.UnsupportedOperation):
+                # Not a real file (e.g., the io.BytesIO built by list_directory()): nothing to cache.
+                return super().copyfile(source, outputfile)
+            if st.st_size <= HTTPS_CACHE_MAX_FILE_SIZE:
+                outputfile.write(_read_static_file(source, st))
+            else: shutil.copyfileobj(source, outputfile, HTTPS_COPY_BUFFER_SIZE)
+        def log_message(self, format, *args): https_logger.info("%s - %s" % (self.address_string(), format % args))
+        def log_error(self, format, *args): https_logger.error("%s - %s" % (self.address_string(), format % args))
+
+    class ThreadingHTTPServer(http.server.ThreadingHTTPServer):
+        """Stdlib threaded HTTPServer; request threads are daemons so in-flight requests never block shutdown."""
+        allow_reuse_address = True
+        daemon_threads = True
+
+    return QuietHTTPRequestHandler, ThreadingHTTPServer
+
+@lru_cache(maxsize=4)
+def _build_ssl_context(cert_file, key_file, cert_mtime_ns, key_mtime_ns):
+    """
+    Creates the HTTPS server SSL context and loads the certificate chain.
+    Cached per (paths, modification times), so restarting with unchanged certificates
+    skips re-reading and re-parsing both PEM files.
+
+    Args:
+        cert_file (str): Path to the certificate file.
+        key_file (str): Path to the private key file.
+        cert_mtime_ns (int): Certificate modification time; part of the cache key only.
+        key_mtime_ns (int): Key modification time; part of the cache key only.
+
+    Returns:
+        ssl.SSLContext: A server-side context with the certificate chain loaded.
+    """
+    import ssl # Deferred: only needed once the HTTPS server is actually started.
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    return context
+
+def _start_https_server_thread(state, host, port, client_dir):
+    """Internal helper to start the HTTPS server thread (recorded in 'state')."""
     print("\nStarting HTTPS server thread...")
+    _setup_https_logging()
+    QuietHTTPRequestHandler, ThreadingHTTPServer = _https_server_classes()
     # Use functools.partial to create a handler factory that includes the directory
     Handler = partial(QuietHTTPRequestHandler, directory=client_dir)
     try:
-        https_server = ThreadingHTTPServer((host, port), Handler)
+        https_server = state.https_server = ThreadingHTTPServer((host, port), Handler)
         print(f"[HTTPS Setup] Setting up SSL context...")
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        context.load_cert_chain(certfile=CERT_FILE, keyfile=KEY_FILE)
+        # Reuses the already-parsed context unless either PEM file changed since the last start.
+        context = _build_ssl_context(CERT_FILE, KEY_FILE, os.stat(CERT_FILE).st_mtime_ns, os.stat(KEY_FILE).st_mtime_ns)
         https_server.socket = context.wrap_socket(https_server.socket, server_side=True)
         print(f"[HTTPS Setup] SSL context loaded and socket wrapped.")
         # Create the thread targeting the server's serve_forever method
-        https_thread = threading.Thread(target=_run_https_server_loop, args=(https_server,), daemon=True)
+        https_thread = state.https_thread = threading.Thread(target=_run_https_server_loop, args=(state, https_server), daemon=True)
         https_thread.start()
         print(f"[HTTPS Thread] Serving HTTPS on {host}:{port} from {client_dir}")
         https_logger.info(f"HTTPS Server starting on {host}:{port}, serving {client_dir}")
@@ -675,12 +966,11 @@ def _start_https_server_thread(host, port, client_dir):
     except Exception as e:
         print(f"\n[HTTPS Setup] ERROR starting HTTPS server: {e}")
         https_logger.exception("Error during HTTPS setup")
-        https_server = None
+        state.https_server = None
         return None
 
-def _run_https_server_loop(server_instance):
+def _run_https_server_loop(state, server_instance):
     """Target function for the HTTPS server thread loop."""
-    global https_server
     try:
         # Call serve_forever on the passed server instance
         server_instance.serve_forever()
@@ -688,83 +978,180 @@ def _run_https_server_loop(server_instance):
         # Log unexpected errors during the serve_forever loop
         https_logger.exception("Unexpected error in HTTPS serve_forever loop")
     finally:
-        # Cleanup: Ensure server is closed and global reference is cleared
+        # Cleanup: Ensure server is closed and the state reference is cleared
         if server_instance:
             try:
                 server_instance.server_close()
             except Exception: pass # Ignore errors during close
         print("[HTTPS Thread] Server loop stopped.")
         https_logger.info("HTTPS Server loop stopped.")
-        https_server = None # Clear the global reference
+        https_file_handler.flush() # Write out any buffered log records.
+        state.https_server = None # Clear the state reference
+        state.monitor_event.set() # Wake the monitor loop so it notices the stopped server right away.
 
 # --- WSS Server Logging ---
-def log_wss_output(process):
-    """Target function for the WSS logging thread."""
+def _use_background_scheduling():
+    """
+    Marks the calling thread as a non-interactive (SCHED_BATCH) thread, so its periodic wakeups do not
+    preempt latency-sensitive work. Only for the WSS log reader/writer threads; the main thread (Ctrl+C
+    handling, shutdown) keeps the normal policy. Linux only; a no-op elsewhere or if not permitted.
+    """
+    if hasattr(os, 'sched_setscheduler') and hasattr(os, 'SCHED_BATCH'):
+        try: os.sched_setscheduler(0, os.SCHED_BATCH, os.sched_param(0)) # 0 = the calling thread on Linux.
+        except OSError: pass
+
+def log_wss_output(process, log_queue, stop_event):
+    """
+    Target function for the WSS logging thread: reads the WSS server's output and queues it for the writer thread.
+    The reader never waits on the console, so it keeps draining the pipe even if terminal output is slow;
+    if the queue is full, output is dropped and the number of dropped lines is reported once there is room again.
+
+    Args:
+        process (subprocess.Popen): The WSS server process whose stdout is read.
+        log_queue (queue.Queue): Queue of text blocks consumed by _write_wss_output(); None marks the end.
+        stop_event (threading.Event): Set when shutdown is requested; output is no longer queued after that.
+    """
     print("[WSS Log Thread] Started.")
+    _use_background_scheduling()
+    dropped = 0 # Lines dropped since the last block that fit into the queue.
+
+    def emit(text, line_count=1):
+        """Queues a block of output without blocking, counting it as dropped if the queue is full."""
+        nonlocal dropped
+        if dropped: text = f"[WSS Log Thread] {dropped} log line(s) dropped (console output backlog).\n{text}"
+        try: log_queue.put_nowait(text); dropped = 0
+        except queue.Full: dropped += line_count
+
     try:
-        # Read stdout line by line from the WSS process.
-        # iter(process.stdout.readline, '') creates an iterator that stops when readline returns an empty string (EOF).
-        for line in iter(process.stdout.readline, ''):
-            # Check if the stop event is set (signaling shutdown).
-            if stop_event.is_set(): break
-            # Print the line received from the WSS server, prefixed.
-            print(f"[WSS] {line.strip()}", flush=True) # flush=True ensures immediate output
+        fd = process.stdout.fileno() # Raw pipe descriptor; reads bypass the Python-level buffer entirely.
+        pending = bytearray() # Carry buffer holding the incomplete trailing line between reads.
+        while not stop_event.is_set():
+            # os.read() returns whatever is available (up to the limit) in a single system call,
+            # so bursts of log lines are pulled from the pipe in bulk rather than per line.
+            chunk = os.read(fd, WSS_LOG_READ_SIZE)
+            if not chunk: break # Empty read means EOF: the WSS process closed its stdout.
+            pending += chunk
+            end = pending.rfind(b'\n')
+            # Wait for more data if no complete line has arrived yet, or skip output if shutdown was requested.
+            if end < 0 or stop_event.is_set(): continue
+            lines = pending[:end].split(b'\n')
+            del pending[:end + 1] # Keep only the incomplete remainder.
+            # Queue the complete lines received from the WSS server, prefixed, as a single block.
+            emit('\n'.join(f"[WSS] {line.decode('utf-8', 'replace').strip()}" for line in lines), len(lines))
+        # Queue any final line that was not newline-terminated.
+        if pending and not stop_event.is_set(): emit(f"[WSS] {pending.decode('utf-8', 'replace').strip()}")
         # Check if the loop ended because the process terminated unexpectedly.
         if not stop_event.is_set() and process.poll() is not None:
-             print("[WSS Log Thread] WSS process stdout EOF or process terminated.", flush=True)
+             emit("[WSS Log Thread] WSS process stdout EOF or process terminated.")
     except Exception as e:
         # Log errors during reading, but only if shutdown wasn't requested.
-        if not stop_event.is_set(): print(f"[WSS Log Thread] Error reading WSS output: {e}", flush=True)
-    finally: print("[WSS Log Thread] Exiting.", flush=True)
+        if not stop_event.is_set(): emit(f"[WSS Log Thread] Error reading WSS output: {e}")
+    finally:
+        emit("[WSS Log Thread] Exiting.")
+        # Tell the writer thread there is no more output (waits briefly for room if the queue is full).
+        try: log_queue.put(None, timeout=2)
+        except queue.Full: pass
+
+def _write_wss_output(log_queue):
+    """
+    Target function for the WSS console writer thread: writes queued WSS output to stdout,
+    batching whatever has accumulated into a single write and flush.
 
-def _start_wss_server_process():
-    """Internal helper to start the WSS server process."""
-    global wss_process, wss_log_thread
+    Args:
+        log_queue (queue.Queue): Queue filled by log_wss_output(); None marks the end of output.
+    """
+    _use_background_scheduling()
+    while True:
+        block = log_queue.get() # Wait for output.
+        if block is None: break # End of output.
+        batch = [block]
+        done = False
+        # Collect whatever else is already queued, up to the batch limit, without waiting.
+        while len(batch) < WSS_LOG_WRITE_BATCH:
+            try: block = log_queue.get_nowait()
+            except queue.Empty: break
+            if block is None: done = True; break
+            batch.append(block)
+        sys.stdout.write('\n'.join(batch) + '\n'); sys.stdout.flush()
+        if done: break
+
+def _watch_wss_process(process, monitor_event):
+    """Target function for the WSS watcher thread: blocks until the process exits, then wakes the monitor loop via 'monitor_event'."""
+    try: process.wait()
+    finally: monitor_event.set()
+
+def _wait_for_process_exit(process, timeout):
+    """
+    Waits for 'process' to exit, like process.wait(timeout), but on Linux (Python 3.9+, kernel 5.3+) sleeps on a
+    pidfd so it wakes the instant the child exits instead of re-checking on a backoff timer.
+
+    Args:
+        process (subprocess.Popen): The process to wait for.
+        timeout (float): Maximum number of seconds to wait.
+
+    Returns:
+        int: The process's exit code.
+
+    Raises:
+        subprocess.TimeoutExpired: If the process is still running after 'timeout' seconds.
+    """
+    if hasattr(os, 'pidfd_open') and process.returncode is None:
+        try: pidfd = os.pidfd_open(process.pid)
+        except OSError: pidfd = None # Unsupported kernel, or the process was already reaped.
+        if pidfd is not None:
+            try:
+                # The pidfd becomes readable when the process terminates.
+                if not select.select([pidfd], [], [], timeout)[0]: raise subprocess.TimeoutExpired(process.args, timeout)
+            finally: os.close(pidfd)
+            timeout = 1 # The child has exited; only the (near-immediate) reaping is left.
+    return process.wait(timeout=timeout)
+
+def _start_wss_server_process(state):
+    """Internal helper to start the WSS server process (recorded in 'state')."""
     print("Starting WSS server subprocess...")
-    wss_script_path = os.path.join(SCRIPT_DIR, 'server', 'main.py')
+    # Fail fast with a clear message rather than letting the child interpreter report a missing script.
+    if not os.path.isfile(WSS_SCRIPT_PATH):
+        print(f"Error: WSS server script not found at {WSS_SCRIPT_PATH}.")
+        return None
     try:
         # Start the server/main.py script using the same Python interpreter.
-        wss_process = subprocess.Popen(
-            [sys.executable, wss_script_path],
-            stdout=subprocess.PIPE, # Capture standard output.
-            stderr=subprocess.STDOUT, # Redirect standard error to standard output.
-            text=True, # Decode output as text using default encoding.
-            encoding='utf-8', # Specify UTF-8 encoding explicitly.
-            bufsize=1, # Line-buffered output.
-            cwd=SCRIPT_DIR # Set working directory to script's directory.
-        )
+        wss_process = state.wss_process = subprocess.Popen(WSS_COMMAND, **WSS_POPEN_KWARGS)
         print(f"WSS server process started (PID: {wss_process.pid}). Output will follow:")
-        # Start a separate thread to read and print the WSS server's output.
-        wss_log_thread = threading.Thread(target=log_wss_output, args=(wss_process,), daemon=True)
-        wss_log_thread.start()
+        # Start a separate thread to read the WSS server's output, and another to print it,
+        # connected by a bounded queue so slow console output never stalls reading the pipe.
+        log_queue = queue.Queue(maxsize=WSS_LOG_QUEUE_SIZE)
+        state.wss_writer_thread = threading.Thread(target=_write_wss_output, args=(log_queue,), daemon=True)
+        state.wss_writer_thread.start()
+        state.wss_log_thread = threading.Thread(target=log_wss_output, args=(wss_process, log_queue, state.stop_event), daemon=True)
+        state.wss_log_thread.start()
+        # Start a watcher thread so a crash is reported as soon as it happens rather than on the next check.
+        threading.Thread(target=_watch_wss_process, args=(wss_process, state.monitor_event), daemon=True).start()
         return wss_process
     except Exception as e:
         print(f"Error starting WSS server process: {e}")
-        wss_process = None
+        state.wss_process = None
         return None
 
 # Note: _monitor_cloudflared_output and _start_cloudflared_tunnel functions removed.
 
 # --- Server Startup and Management ---
-def start_servers(settings): # Renamed from manage_running_servers, simplified
+def start_servers(settings, state=None): # Renamed from manage_running_servers, simplified
     """
     Starts the HTTPS server thread and WSS server process.
     Manages running servers and handles graceful shutdown.
 
     Args:
         settings (dict): The current configuration settings (includes WSS and HTTPS).
+        state (ManagerState, optional): Holder for the session's servers and threads; a fresh one is created if omitted.
     """
-    global wss_process, https_thread, wss_log_thread, https_server, stop_event
-
-    # Reset global state before starting
-    wss_process, https_thread, wss_log_thread, https_server = None, None, None, None
-    stop_event.clear()
+    if state is None: state = ManagerState() # Fresh state: no servers, events cleared.
+    stop_event = state.stop_event
 
     servers_started_ok = False
     print("Starting local servers...")
     # Start the HTTPS server thread first, using settings from the dictionary.
     https_thread = _start_https_server_thread(
-        settings['https_host'], settings['https_port'], HTTPS_CLIENT_DIR
+        state, settings['https_host'], settings['https_port'], HTTPS_CLIENT_DIR
     )
     time.sleep(1.0) # Allow HTTPS server time to bind to the port or fail.
 
@@ -772,7 +1159,7 @@ def start_servers(settings): # Renamed from manage_running_servers, simplified
     if https_thread and https_thread.is_alive():
         # If HTTPS is okay, start the WSS server process.
         # WSS server reads its config (HOST/PORT/DEBUG) from server/config.py directly.
-        wss_process = _start_wss_server_process()
+        wss_process = _start_wss_server_process(state)
         if wss_process:
             servers_started_ok = True # Both servers started successfully.
         else: print("Failed to start WSS server process. Shutting down HTTPS server.")
@@ -782,26 +1169,29 @@ def start_servers(settings): # Renamed from manage_running_servers, simplified
     if not servers_started_ok:
          stop_event.set() # Signal threads to stop.
          # Call simplified shutdown logic directly.
-         _shutdown_servers()
+         _shutdown_servers(state)
          print("Exiting due to server startup failure.")
          sys.exit(1) # Exit the manager script.
 
     # --- Manage Running Servers ---
     print("\nServers are running. Press Ctrl+C to stop.")
     try:
+        # Both servers are known to be running here; bind their status checks to locals once.
+        wss_poll, https_alive, stopped, wake = wss_process.poll, https_thread.is_alive, stop_event.is_set, state.monitor_event
         # Main loop to monitor server status while running.
-        while not stop_event.is_set():
-            # Check if the WSS process has terminated unexpectedly.
-            if wss_process and wss_process.poll() is not None:
-                print(f"\nError: WSS server process terminated unexpectedly (Exit Code: {wss_process.returncode}).")
+        while not stopped():
+            # Single check for the common case where both servers are healthy.
+            if wss_poll() is not None or not https_alive():
+                # Check if the WSS process has terminated unexpectedly.
+                if wss_process.returncode is not None:
+                    print(f"\nError: WSS server process terminated unexpectedly (Exit Code: {wss_process.returncode}).")
+                # Otherwise the HTTPS thread has terminated unexpectedly.
+                # Differentiate between thread dying and server failing during startup.
+                elif state.https_server is not None: print("\nError: HTTPS server thread terminated unexpectedly.")
+                else: print("\nError: HTTPS server failed during startup.")
                 stop_event.set(); break # Signal shutdown and exit loop.
-            # Check if the HTTPS thread has terminated unexpectedly.
-            if https_thread and not https_thread.is_alive():
-                 # Differentiate between thread dying and server failing during startup.
-                 if https_server is not None: print("\nError: HTTPS server thread terminated unexpectedly.")
-                 else: print("\nError: HTTPS server failed during startup.")
-                 stop_event.set(); break # Signal shutdown and exit loop.
-            time.sleep(0.5) # Pause briefly to avoid busy-waiting.
+            # Pace the checks, but wake immediately when a watcher reports that a server exited.
+            wake.wait(0.5); wake.clear()
     except KeyboardInterrupt:
         # Handle Ctrl+C gracefully.
         print("\nShutdown signal (Ctrl+C) received..."); stop_event.set()
@@ -811,31 +1201,32 @@ def start_servers(settings): # Renamed from manage_running_servers, simplified
     finally:
         # --- Graceful Shutdown Sequence ---
         # Ensure shutdown logic runs regardless of how the loop exited.
-        _shutdown_servers()
-
-def _shutdown_servers():
-    """Internal helper to perform the shutdown sequence."""
-    global wss_process, https_thread, wss_log_thread, https_server
+        _shutdown_servers(state)
 
+def _shutdown_servers(state):
+    """Internal helper to perform the shutdown sequence for the servers recorded in 'state'."""
     print("Initiating server shutdown...")
 
     # Shutdown HTTPS Server
     # Check if the server instance exists.
+    https_server, https_thread = state.https_server, state.https_thread
     if https_server: print("Shutting down HTTPS server..."); https_server.shutdown()
     # Check if the thread exists and is alive.
     if https_thread and https_thread.is_alive():
         print("Waiting for HTTPS thread..."); https_thread.join(timeout=5)
         # Check again if the thread terminated gracefully.
         if https_thread.is_alive(): print("Warning: HTTPS thread did not exit gracefully.")
-    https_thread = None # Clear the global reference.
+    state.https_thread = None # Clear the state reference.
+    if https_file_handler: https_file_handler.flush() # Persist buffered HTTPS log records.
 
     # Shutdown WSS Process
     # Check if the process exists and is still running.
+    wss_process = state.wss_process
     if wss_process and wss_process.poll() is None:
         print("Terminating WSS server process...")
         try:
             # Attempt graceful termination first.
-            wss_process.terminate(); wss_process.wait(timeout=5)
+            wss_process.terminate(); _wait_for_process_exit(wss_process, 5)
             print("WSS server process terminated.")
         except subprocess.TimeoutExpired:
             # If terminate fails, forcefully kill the process.
@@ -843,15 +1234,19 @@ def _shutdown_servers():
             try: wss_process.wait(timeout=2) # Wait briefly after kill.
             except Exception: pass # Ignore errors during wait after kill.
         except Exception as e: print(f"Error terminating WSS process: {e}")
-        finally: wss_process = None # Clear the global reference.
+        finally: state.wss_process = None # Clear the state reference.
 
     # Shutdown WSS Logging Thread
     # Check if the thread exists and is alive.
+    wss_log_thread, wss_writer_thread = state.wss_log_thread, state.wss_writer_thread
     if wss_log_thread and wss_log_thread.is_alive():
         print("Waiting for WSS logging thread..."); wss_log_thread.join(timeout=2)
         # Check again if the thread terminated gracefully.
         if wss_log_thread.is_alive(): print("Warning: WSS logging thread did not exit.")
-    wss_log_thread = None # Clear the global reference.
+    state.wss_log_thread = None # Clear the state reference.
+    # The writer exits once it has printed everything the logging thread queued.
+    if wss_writer_thread and wss_writer_thread.is_alive(): wss_writer_thread.join(timeout=2)
+    state.wss_writer_thread = None # Clear the state reference.
 
     print("Shutdown complete.")
 
@@ -14,13 +14,53 @@ HOST = '0.0.0.0'
 # This must match the port specified in the client's 'config.js' (webSocketPort).
 PORT = 5678
 
+# --- Socket Tuning ---
+
+# Disable Nagle's algorithm on client connections so small WebSocket frames are sent immediately.
+# (asyncio already enables TCP_NODELAY by default; set to False to turn it back off.)
+TCP_NODELAY = True
+
+# Allow several server processes to bind the same HOST/PORT, with the kernel spreading new connections
+# between them (SO_REUSEPORT; Linux/BSD/macOS only). Leave False when running a single server.
+# Note: each process has its own client registry, so peers must connect to the same process to talk.
+SO_REUSEPORT = False
+
+# Maximum number of pending (not yet accepted) connections queued on the listening socket.
+SOCKET_BACKLOG = 2048
+
+# Maximum size (bytes) of a single incoming WebSocket message; larger messages close the connection.
+# Must fit one file chunk (CHUNK_SIZE in client/js/SessionManager.js) after encryption and Base64 encoding,
+# plus the JSON envelope (type, IDs, IV, index).
+# Example: 256KB chunk -> Base64 grows it by 4/3 -> ~342KB, + <1KB JSON -> ~343KB frame, so 512KB leaves headroom.
+# Do not set this below ~4/3 x CHUNK_SIZE, or every file transfer fails on its first chunk.
+MAX_MESSAGE_SIZE = 512 * 1024
+
+# Per-connection buffering (passed to websockets.serve as max_queue / write_limit).
+# WS_MAX_QUEUE: number of *messages* (not bytes) received from one client and buffered before the server
+#   stops reading that socket. Lower = less memory per connection (worst case WS_MAX_QUEUE x MAX_MESSAGE_SIZE);
+#   higher = more burst absorbed while the handler is busy relaying. Bursts are capped by the message rate
+#   limit anyway (MAX_MESSAGES_PER_CONNECTION), so a small queue costs no throughput.
+WS_MAX_QUEUE = 8
+# WS_WRITE_LIMIT: outgoing buffer high-water mark in *bytes*. Relaying to a client waits once more than this is
+#   still unsent to it, which also pauses the sending client's handler (backpressure towards slow receivers).
+#   Lower = less memory held for slow clients; higher = fewer stalls. Keep it at least one file-chunk frame
+#   (~343KB, see MAX_MESSAGE_SIZE) so a chunk relay does not wait for the previous chunk to drain completely.
+WS_WRITE_LIMIT = 512 * 1024
+
+# Keepalive pings (both in *seconds*): a ping every WS_PING_INTERVAL; the connection is closed if the pong does
+# not arrive within WS_PING_TIMEOUT. Lower = dead peers (and their registrations) are freed sooner;
+# higher = less idle traffic and more tolerance for slow or briefly stalled networks.
+WS_PING_INTERVAL = 30
+WS_PING_TIMEOUT = 20
+
 # --- SSL Configuration ---
 # Settings related to enabling Secure WebSockets (WSS) using TLS/SSL certificates.
 
 # Define the directory where SSL certificate files are expected to be located.
 # os.path.dirname(__file__) gets the directory containing this config.py file.
 # os.path.join then constructs a path like '<parent_directory>/certs/'.
-CERT_DIR = os.path.join(os.path.dirname(__file__), '..', 'certs')
+# os.path.realpath resolves the '..' (and any symlinks) once here, so every later use is a canonical absolute path.
+CERT_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', 'certs'))
 
 # Define the expected filename for the SSL certificate file (public key).
 # This should be the certificate generated (e.g., by mkcert).
@@ -35,18 +75,32 @@ KEY_FILE = os.path.join(CERT_DIR, 'key.pem')
 # Set to False to use WS (unencrypted, generally only for local testing).
 ENABLE_SSL = True
 
+# Whether SSL is enabled AND both certificate files exist, checked once at import.
+# The server uses this instead of probing the filesystem again when setting up SSL.
+SSL_READY = ENABLE_SSL and os.path.isfile(CERT_FILE) and os.path.isfile(KEY_FILE)
+
+# Number of TLS 1.3 session tickets issued per new connection. Reconnecting clients present a ticket to
+# resume the session and skip the full handshake (key exchange + certificate verification).
+# Set to 0 to disable session tickets.
+TLS_SESSION_TICKETS = 2
+
 # --- Rate Limiting Configuration ---
+# Both limits are token buckets: up to MAX_* events may arrive in a burst, and the allowance
+# refills continuously at MAX_* events per *_WINDOW_SECONDS.
+# Note: this is NOT a hard cap per window. A client that saves up a full burst and then keeps sending at
+# the refill rate gets up to 2 x MAX_* events into a single window (the burst + one window of refill).
+# The long-run rate is MAX_* per window.
 
 # Connection Rate Limiting (per IP address)
-# Maximum number of connection attempts allowed from a single IP within the specified time window.
+# Burst size and sustained rate (per CONNECTION_WINDOW_SECONDS) of connection attempts from a single IP.
 MAX_CONNECTIONS_PER_IP = 10
-# Time window in seconds for connection rate limiting.
+# Time window in seconds for connection rate limiting (the bucket refills fully over this period).
 CONNECTION_WINDOW_SECONDS = 60
 
 # Message Rate Limiting (per connection)
-# Maximum number of messages allowed from a single connection within the specified time window.
+# Burst size and sustained rate (per MESSAGE_WINDOW_SECONDS) of messages from a single connection.
 MAX_MESSAGES_PER_CONNECTION = 20
-# Time window in seconds for message rate limiting.
+# Time window in seconds for message rate limiting (the bucket refills fully over this period).
 MESSAGE_WINDOW_SECONDS = 5
 
 # --- File Transfer Configuration ---
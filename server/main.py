@@ -7,6 +7,10 @@ import asyncio  # For running the asynchronous server event loop.
 import config   # Imports server configuration variables (HOST, PORT, SSL settings).
 import server   # Imports the main server logic (start_server function, handlers).
 import logging  # Imports the logging module for status and error messages.
+try:
+    import uvloop  # Optional: faster libuv-based event loop (not available on Windows).
+except ImportError:
+    uvloop = None  # Fall back to asyncio's default event loop.
 
 # Configure basic logging settings for the server.
 # - level=logging.INFO: Sets the minimum severity level to log (INFO, WARNING, ERROR, CRITICAL).
@@ -24,10 +28,19 @@ if __name__ == "__main__":
         logging.info(f"Using HOST={config.HOST}, PORT={config.PORT}")
 
         # Start the asyncio event loop and run the main server startup function.
-        # asyncio.run() manages the event loop lifecycle.
+        # asyncio.run() / asyncio.Runner manage the event loop lifecycle.
         # server.start_server() (defined in server.py) contains the core logic
         # to initialize and run the websockets server.
-        asyncio.run(server.start_server(config.HOST, config.PORT))
+        if uvloop is not None and hasattr(asyncio, 'Runner'): # asyncio.Runner needs Python 3.11+.
+            logging.info("Using uvloop event loop.")
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                runner.run(server.start_server(config.HOST, config.PORT))
+        elif uvloop is not None:
+            logging.info("Using uvloop event loop.")
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            asyncio.run(server.start_server(config.HOST, config.PORT))
+        else:
+            asyncio.run(server.start_server(config.HOST, config.PORT))
 
     except KeyboardInterrupt:
         # Handle graceful shutdown if the user presses Ctrl+C.
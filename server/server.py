@@ -9,24 +9,113 @@ import websockets       # The WebSocket library used for server and client handl
 import logging          # For logging server events, warnings, and errors.
 import json             # For parsing and serializing JSON messages between client and server.
 import ssl              # For creating SSL contexts if WSS (Secure WebSockets) is enabled.
+import socket           # For per-connection socket options (TCP_NODELAY)
 import time             # For rate limiting timestamps
 import re               # For identifier validation using regex
+import os               # For certificate file modification times (SSL context cache key)
+import weakref          # For per-connection registries that cannot outlive their connection
+import signal           # For SIGINT/SIGTERM handling (clean shutdown)
+from functools import lru_cache # For building the SSL context once per certificate/key pair
 import config           # Imports server configuration (HOST, PORT, SSL settings, Rate Limits, DEBUG).
+try:
+    import orjson       # Optional: much faster JSON parsing/serialization (C extension).
+except ImportError:
+    orjson = None       # Fall back to the standard library json module.
 
 
+# --- Logging Formatter ---
+class CachedTimeFormatter(logging.Formatter):
+    """
+    logging.Formatter that renders the same '%(asctime)s' text as the default, but only runs
+    time.localtime()/strftime() once per second; records within the same second reuse the cached text.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second = (None, '') # (whole second, formatted text); replaced as a unit so threads never see a mismatch.
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt: return super().formatTime(record, datefmt) # Custom formats are not cached.
+        second = int(record.created)
+        cached = self._cached_second
+        if cached[0] != second:
+            cached = self._cached_second = (second, time.strftime(self.default_time_format, self.converter(second)))
+        return self.default_msec_format % (cached[1], record.msecs)
+
 # Configure basic logging (can also be done in main.py, ensures it's set).
 # Level INFO means INFO, WARNING, ERROR, CRITICAL messages will be shown.
 # Format includes timestamp, log level, and the message itself.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(CachedTimeFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
+# Module logger, resolved once. Records propagate to the root handler configured above (same output format);
+# calling it directly skips the root-logger lookup and basicConfig check that logging.info() etc. do per call.
+logger = logging.getLogger("helix.server")
+
+# Debug flag, read once at import so hot paths test a module global instead of a config attribute.
+DEBUG = config.DEBUG
+# Maximum incoming WebSocket message size in bytes (see config.py).
+MAX_MESSAGE_SIZE = config.MAX_MESSAGE_SIZE
+# Repeats of the same unexpected per-message error on a connection within this many seconds are logged
+# without a traceback (see connection_handler).
+ERROR_LOG_REPEAT_SECONDS = 5
+
+# --- JSON Serialization ---
+# json_loads/json_dumps use orjson when it is installed, otherwise the standard library.
+# Both variants take/return str so outgoing messages stay text WebSocket frames.
+# (orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except clause covers both.)
+if orjson is not None:
+    json_loads = orjson.loads
+    def json_dumps(obj): return orjson.dumps(obj).decode('utf-8')
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
 
 # --- Identifier Validation ---
-# Regex pattern for valid identifiers:
-# - Starts with a letter or number (^[a-zA-Z0-9])
+# Regex pattern for valid identifiers (applied with fullmatch, so the whole string must match):
+# - Starts with a letter or number ([a-zA-Z0-9])
 # - Contains only letters, numbers, underscores, hyphens ([a-zA-Z0-9_-]*)
-# - Is between 3 and 30 characters long ({2,29}$) - Note: {2,29} because the first char is already matched.
-VALID_IDENTIFIER_REGEX = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_-]{2,29}$")
-# Regex pattern for basic Base64 character validation (A-Z, a-z, 0-9, +, /, =)
-BASE64_CHARS_REGEX = re.compile(r"^[A-Za-z0-9+/=]+$") # Added for specific chunk data validation
+# - Is between 3 and 30 characters long ({2,29}) - Note: {2,29} because the first char is already matched.
+# (fullmatch rather than match with '^...$': '$' also matches before a trailing newline, so 'abc\n' used to pass.)
+VALID_IDENTIFIER_REGEX = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9_-]{2,29}")
+# Allowed characters for basic Base64 validation (A-Z, a-z, 0-9, +, /, =).
+# Checked with bytes.translate(None, BASE64_CHARS), which deletes them in one C-level pass:
+# a value is Base64-like if nothing is left over. Several times faster than a regex on large payloads.
+BASE64_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+
+
+# --- Payload Field Validation Helpers ---
+def is_valid_string(value, max_len=50):
+    """
+    Checks that a payload field is a string that is not blank and at most 'max_len' characters long.
+
+    Args:
+        value: The payload field value to check.
+        max_len (int): Maximum allowed length.
+
+    Returns:
+        bool: True if valid, False otherwise.
+    """
+    # Equivalent to 0 < len(value.strip()) <= max_len, but without allocating a stripped copy in the
+    # common case: a string within the limit is valid unless it is empty or all whitespace.
+    # (type() is used instead of isinstance(): parsed JSON strings are always exactly str.)
+    if type(value) is not str or not value or value.isspace(): return False
+    return len(value) <= max_len or len(value.strip()) <= max_len
+
+def is_valid_base64_like(value, max_len=1024*128): # Default max length from Session.js
+    """
+    Basic check that a payload field looks like Base64: a non-empty string within the length limit
+    containing only valid Base64 characters. This is NOT a full Base64 validation but catches many obvious errors.
+
+    Args:
+        value: The payload field value to check.
+        max_len (int): Maximum allowed length.
+
+    Returns:
+        bool: True if valid, False otherwise.
+    """
+    # Use BASE64_CHARS defined above (isascii() first so encode() cannot fail)
+    return (isinstance(value, str) and 0 < len(value) <= max_len and value.isascii()
+            and not value.encode('ascii').translate(None, BASE64_CHARS))
 
 # --- Global Registries ---
 
@@ -38,16 +127,73 @@ CLIENTS = {}
 # CONNECTIONS: A reverse lookup dictionary mapping active WebSocket connection objects
 # to their registered client identifiers (strings). Allows finding a client's ID from their connection.
 # Example: {<WebSocketConnection object for Alice>: 'Alice123', <WebSocketConnection object for Bob>: 'Bob456'}
-CONNECTIONS = {}
+# Weak keys: entries are normally removed by unregister_client, but if that cleanup were ever skipped the entry
+# disappears with the connection object instead of accumulating. (Not on the per-message path: the handler
+# keeps the sender's ID in a local.)
+CONNECTIONS = weakref.WeakKeyDictionary()
 
 # --- Rate Limiting State ---
-# CONNECTION_ATTEMPTS: Tracks recent connection timestamps per IP address.
-# Structure: { 'ip_address': [timestamp1, timestamp2, ...], ... }
+class TokenBucket:
+    """
+    Token-bucket rate limiter: holds up to 'max_events' tokens, refilled continuously at
+    max_events / window_seconds tokens per second; each accepted event consumes one token.
+    Allows a burst of up to 'max_events', then a sustained max_events per window_seconds. The per-window
+    bound is therefore 2 x max_events, not max_events: a full bucket drained at once plus one window of
+    refill can both land inside the same window_seconds span.
+    """
+    __slots__ = ('tokens', 'last_refill') # Two floats per key; no per-instance __dict__.
+
+    def __init__(self, now, max_events):
+        self.tokens = float(max_events) # Start full.
+        self.last_refill = now
+
+    def allow(self, now, window_seconds, max_events):
+        """
+        Refills the bucket for the time elapsed since the last call, then consumes a token if one is available.
+
+        Args:
+            now (float): The current time.monotonic() value.
+            window_seconds (float): Time in seconds to refill the bucket completely.
+            max_events (int): Bucket capacity (maximum burst size).
+
+        Returns:
+            bool: True if the event is within the limit (and consumed a token), False if it must be rejected.
+        """
+        tokens = self.tokens + (now - self.last_refill) * max_events / window_seconds
+        self.last_refill = now
+        if tokens > max_events: tokens = max_events # Cap at the bucket capacity.
+        # Rejected events do not consume a token.
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+# CONNECTION_ATTEMPTS: Connection rate limit bucket per IP address.
+# Structure: { 'ip_address': TokenBucket, ... }
 CONNECTION_ATTEMPTS = {}
 
-# MESSAGE_TIMESTAMPS: Tracks recent message timestamps per active WebSocket connection.
-# Structure: { <websocket object>: [timestamp1, timestamp2, ...], ... }
-MESSAGE_TIMESTAMPS = {}
+
+async def sweep_connection_attempts():
+    """
+    Background task: periodically drops CONNECTION_ATTEMPTS buckets that have been idle for a full window.
+
+    A bucket idle for CONNECTION_WINDOW_SECONDS has refilled completely, so it behaves exactly like the fresh
+    bucket connection_handler would create; deleting it keeps the dictionary bounded by recently seen IPs
+    without changing any rate-limit decision.
+    """
+    window = config.CONNECTION_WINDOW_SECONDS
+    while True:
+        await asyncio.sleep(window)
+        cutoff = time.monotonic() - window
+        # Collect first, then delete (the dict must not change size while iterating).
+        stale_ips = [ip for ip, bucket in CONNECTION_ATTEMPTS.items() if bucket.last_refill <= cutoff]
+        for ip in stale_ips: del CONNECTION_ATTEMPTS[ip]
+        if DEBUG and stale_ips:
+            logger.info("Removed %s idle connection rate limit entries (%s remaining).", len(stale_ips), len(CONNECTION_ATTEMPTS))
+
+# Message rate limit buckets are per connection and only ever used by that connection's handler,
+# so each one lives in a connection_handler local rather than in a global registry.
 
 # --- Active Session Tracking ---
 # ACTIVE_SESSIONS: Maps an identifier to their current active chat peer's identifier.
@@ -56,36 +202,96 @@ MESSAGE_TIMESTAMPS = {}
 ACTIVE_SESSIONS = {}
 
 
-# --- Helper function to send JSON messages ---
-async def send_json(websocket, message_type, payload):
+def link_session(id_a, id_b):
     """
-    Helper function to format a message as JSON and send it over a WebSocket connection.
-    Handles JSON serialization and logs the outgoing message (if DEBUG is True).
-    Includes basic error handling for closed connections during send.
+    Records an active session between two identifiers (both directions).
+
+    All ACTIVE_SESSIONS edits go through link_session / unlink_session so the two entries stay in step.
+    """
+    ACTIVE_SESSIONS[id_a] = id_b
+    ACTIVE_SESSIONS[id_b] = id_a
+
+
+def unlink_session(identifier, peer_id=None):
+    """
+    Removes the active session of 'identifier' (both directions), if any.
+
+    Args:
+        identifier (str): The identifier whose session should be cleared.
+        peer_id (str, optional): Only clear the session if it is with this peer. Defaults to any peer.
+
+    Returns:
+        str or None: The peer identifier that was unlinked, or None if nothing was removed.
+    """
+    current_peer = ACTIVE_SESSIONS.get(identifier)
+    if current_peer is None or (peer_id is not None and current_peer != peer_id): return None
+    del ACTIVE_SESSIONS[identifier]
+    # Only drop the peer's entry if it still points back at us (the peer may have moved on to a new session).
+    if ACTIVE_SESSIONS.get(current_peer) == identifier: del ACTIVE_SESSIONS[current_peer]
+    return current_peer
+
+
+# --- Helper functions to send JSON messages ---
+async def send_text(websocket, message):
+    """
+    Sends an already serialized JSON message string over a WebSocket connection.
+    Logs the outgoing message (if DEBUG is True) and handles closed connections during send.
 
     Args:
         websocket: The websockets.WebSocketServerProtocol object representing the client connection.
-        message_type: The numeric type identifier for the message (e.g., 0.1, 0.2, -1, -2, 9).
-        payload: The dictionary containing the message data.
+        message (str): The JSON-encoded message to send (as a text frame).
     """
     try:
-        # Create the message dictionary.
-        message_dict = {"type": message_type, "payload": payload}
-        # Serialize the dictionary to a JSON string.
-        message = json.dumps(message_dict)
         # Log the message being sent only if DEBUG is enabled.
-        if config.DEBUG:
-            logging.info(f"Sending to {websocket.remote_address} ({CONNECTIONS.get(websocket, 'N/A')}): {message}")
+        if DEBUG:
+            logger.info("Sending to %s (%s): %s", websocket.remote_address, CONNECTIONS.get(websocket, 'N/A'), message)
         # Send the JSON string over the WebSocket.
         await websocket.send(message)
     except websockets.exceptions.ConnectionClosed as e:
         # Log a warning specifically if the send fails because the connection is already closed.
         # This warning is important regardless of DEBUG level.
-        logging.warning(f"Failed to send to {websocket.remote_address} ({CONNECTIONS.get(websocket, 'N/A')}) because connection is closed: {e}")
+        logger.warning("Failed to send to %s (%s) because connection is closed: %s", websocket.remote_address, CONNECTIONS.get(websocket, 'N/A'), e)
     except Exception as e:
-        # Catch other exceptions during json.dumps or websocket.send (less common)
+        # Catch other exceptions during websocket.send (less common)
         # Always log unexpected exceptions.
-        logging.exception(f"Unexpected error sending JSON to {websocket.remote_address} ({CONNECTIONS.get(websocket, 'N/A')})")
+        logger.exception("Unexpected error sending JSON to %s (%s)", websocket.remote_address, CONNECTIONS.get(websocket, 'N/A'))
+
+
+async def send_json(websocket, message_type, payload):
+    """
+    Helper function to format a message as JSON and send it over a WebSocket connection.
+    Handles JSON serialization; sending, logging and closed-connection handling are done by send_text.
+
+    Args:
+        websocket: The websockets.WebSocketServerProtocol object representing the client connection.
+        message_type: The numeric type identifier for the message (e.g., 0.1, 0.2, -1, -2, 9).
+        payload: The dictionary containing the message data.
+    """
+    try:
+        # Create the message dictionary and serialize it to a JSON string.
+        message = json_dumps({"type": message_type, "payload": payload})
+    except Exception as e:
+        # Always log unexpected exceptions (e.g., a payload value that cannot be serialized).
+        logger.exception("Unexpected error serializing JSON for %s (%s)", websocket.remote_address, CONNECTIONS.get(websocket, 'N/A'))
+        return
+    await send_text(websocket, message)
+
+
+# Pre-built Type -1 (User Unavailable) error; only the target ID is filled in per use.
+# Equivalent to send_json(websocket, -1, {"targetId": ..., "message": "User '...' is unavailable."}).
+USER_UNAVAILABLE_TEMPLATE = '{"type":-1,"payload":{"targetId":%s,"message":"User \'%s\' is unavailable."}}'
+
+
+async def send_user_unavailable(websocket, target_id):
+    """
+    Sends the standardized Type -1 error telling a client that 'target_id' is not reachable.
+
+    Args:
+        websocket: The connection of the client that tried to reach 'target_id'.
+        target_id (str): The identifier that could not be reached.
+    """
+    quoted_id = json_dumps(target_id) # JSON string literal, escaping included
+    await send_text(websocket, USER_UNAVAILABLE_TEMPLATE % (quoted_id, quoted_id[1:-1]))
 
 
 # --- Registration Logic ---
@@ -103,14 +309,14 @@ async def handle_registration(websocket, identifier):
     """
     client_address = websocket.remote_address
     # Log handling attempt only if DEBUG is enabled.
-    if config.DEBUG:
-        logging.info(f"Handling registration request for '{identifier}' from {client_address}")
+    if DEBUG:
+        logger.info("Handling registration request for '%s' from %s", identifier, client_address)
 
     # --- Check Availability ---
     # Check if the requested identifier is already present in the CLIENTS registry.
     if identifier in CLIENTS:
         # Always log warnings about failed registrations.
-        logging.warning(f"Identifier '{identifier}' already taken. Denying request from {client_address}.")
+        logger.warning("Identifier '%s' already taken. Denying request from %s.", identifier, client_address)
         # Send failure message (Type 0.2) indicating the ID is taken.
         await send_json(websocket, 0.2, {"identifier": identifier, "error": "Identifier already taken."})
     # Check if this specific WebSocket connection is already registered in the CONNECTIONS registry.
@@ -118,7 +324,7 @@ async def handle_registration(websocket, identifier):
          # This prevents a single client from registering multiple IDs.
          existing_id = CONNECTIONS[websocket]
          # Always log warnings about failed registrations.
-         logging.warning(f"Client {client_address} tried to register '{identifier}' but is already registered as '{existing_id}'. Denying.")
+         logger.warning("Client %s tried to register '%s' but is already registered as '%s'. Denying.", client_address, identifier, existing_id)
          # Send failure message (Type 0.2) indicating they are already registered.
          await send_json(websocket, 0.2, {"identifier": identifier, "error": f"You are already registered as '{existing_id}'."})
     else:
@@ -128,16 +334,16 @@ async def handle_registration(websocket, identifier):
         # Add the websocket -> identifier mapping to CONNECTIONS.
         CONNECTIONS[websocket] = identifier
         # Log successful registration (important event, not wrapped in DEBUG).
-        logging.info(f"Identifier '{identifier}' registered successfully for {client_address}")
+        logger.info("Identifier '%s' registered successfully for %s", identifier, client_address)
         # Send success message (Type 0.1) back to the client.
         await send_json(websocket, 0.1, {"identifier": identifier, "message": "Registration successful."})
 
 
 # --- Unregistration Logic ---
-def unregister_client(websocket):
+async def unregister_client(websocket):
     """
     Removes a client's registration information from the global registries (CLIENTS and CONNECTIONS).
-    If the client was in an active session, attempts to notify the peer (Type 9).
+    If the client was in an active session, notifies the peer (Type 9) once the registries are updated.
     Also cleans up session tracking in ACTIVE_SESSIONS.
 
     Args:
@@ -145,39 +351,34 @@ def unregister_client(websocket):
     """
     peer_id = None # Initialize peer_id
     identifier = None # Initialize identifier
+    peer_websocket = None # Connection of the peer to notify, if any
 
     # Check if the disconnecting client was actually registered (i.e., present in CONNECTIONS).
     if websocket in CONNECTIONS:
         # Retrieve the identifier associated with this connection.
         identifier = CONNECTIONS[websocket]
         # Log unregistration (important event, not wrapped in DEBUG).
-        logging.info(f"Unregistering client {websocket.remote_address} with ID '{identifier}'")
+        logger.info("Unregistering client %s with ID '%s'", websocket.remote_address, identifier)
 
         # --- BEGIN Disconnect Notification Logic ---
         # Check if this client was in an active session.
-        if identifier in ACTIVE_SESSIONS:
-            peer_id = ACTIVE_SESSIONS.pop(identifier, None) # Get peer and remove sender's entry
-            if peer_id and peer_id in ACTIVE_SESSIONS:
-                ACTIVE_SESSIONS.pop(peer_id, None) # Remove peer's entry if it exists
+        peer_id = unlink_session(identifier) # Get peer and remove both entries
+        if peer_id:
             # Log session clearing only if DEBUG is enabled.
-            if config.DEBUG:
-                logging.info(f"Cleared active session tracking for {identifier} and {peer_id}")
-
-            # If a peer was found, try to notify them.
-            if peer_id:
-                peer_websocket = CLIENTS.get(peer_id)
-                if peer_websocket: # Check if the peer is still connected
-                    # Log notification attempt only if DEBUG is enabled.
-                    if config.DEBUG:
-                        logging.info(f"Notifying peer {peer_id} about {identifier}'s disconnection.")
-                    # Construct the Type 9 payload (Session End)
-                    notification_payload = {"targetId": peer_id, "senderId": identifier}
-                    # Schedule the send operation as a task so it doesn't block unregister_client
-                    asyncio.create_task(send_json(peer_websocket, 9, notification_payload))
-                else:
-                    # Log peer already disconnected only if DEBUG is enabled.
-                    if config.DEBUG:
-                        logging.info(f"Peer {peer_id} was already disconnected. No notification sent.")
+            if DEBUG:
+                logger.info("Cleared active session tracking for %s and %s", identifier, peer_id)
+
+            # Try to notify the peer.
+            peer_websocket = CLIENTS.get(peer_id)
+            if peer_websocket: # Check if the peer is still connected
+                # Log notification attempt only if DEBUG is enabled.
+                if DEBUG:
+                    logger.info("Notifying peer %s about %s's disconnection.", peer_id, identifier)
+                # The Type 9 notification is sent below, after the registries are cleaned up.
+            else:
+                # Log peer already disconnected only if DEBUG is enabled.
+                if DEBUG:
+                    logger.info("Peer %s was already disconnected. No notification sent.", peer_id)
         # --- END Disconnect Notification Logic ---
 
         # Remove the entry from the CLIENTS registry (ID -> connection).
@@ -186,9 +387,121 @@ def unregister_client(websocket):
         # Remove the entry from the CONNECTIONS registry (connection -> ID).
         del CONNECTIONS[websocket] # Do this after potentially using the identifier
 
+        # Send the Type 9 (Session End) notification directly; send_json handles a peer that closed meanwhile.
+        if peer_websocket:
+            await send_json(peer_websocket, 9, {"targetId": peer_id, "senderId": identifier})
+
     else:
         # Log if a client disconnects without ever registering an ID (important event, not wrapped).
-        logging.info(f"Client {websocket.remote_address} disconnected but had no registered ID.")
+        logger.info("Client %s disconnected but had no registered ID.", websocket.remote_address)
+
+
+# --- Message Type Specific Validation ---
+# One validator per message type (or group of types with the same payload shape), dispatched through
+# PAYLOAD_VALIDATORS. Each returns True if the payload is valid. Validators log specific problems themselves;
+# connection_handler logs the generic "Invalid Type" warning for any failure.
+# Arguments (all validators):
+#   websocket: The sender's WebSocket connection (used for log messages).
+#   message_type: The numeric message type.
+#   payload (dict): The message payload.
+#   target_id: The payload's 'targetId' value (may be None).
+# The 'senderId' rule is the same for every type, so connection_handler checks it once before dispatch.
+
+def validate_registration(websocket, message_type, payload, target_id):
+    """Type 0 (Registration): identifier must be a valid identifier string."""
+    identifier = payload.get("identifier")
+    # is_valid_string rejects non-strings and over-long values before the regex runs.
+    if not is_valid_string(identifier, 30) or not VALID_IDENTIFIER_REGEX.fullmatch(identifier):
+        # Error is sent back by connection_handler if the basic type/length is wrong.
+        logger.warning("Invalid identifier format/type in Type 0 payload from %s. Ignoring: %s", websocket.remote_address, payload)
+        return False
+    return True
+
+def validate_target_only(websocket, message_type, payload, target_id):
+    """Simple target/sender types (1, 3, 7, 7.1 SAS Confirm, 9, 10, 11)."""
+    if not is_valid_string(target_id):
+        logger.warning("Invalid 'targetId' in Type %s payload from %s. Ignoring: %s", message_type, websocket.remote_address, payload)
+        return False
+    return True
+
+def validate_public_key(websocket, message_type, payload, target_id):
+    """Public Key types (2, 4)."""
+    if not is_valid_string(target_id): return False
+    if not is_valid_base64_like(payload.get("publicKey"), 512): # Check publicKey (SPKI format is relatively short)
+        logger.warning("Invalid 'publicKey' in Type %s payload from %s. Ignoring.", message_type, websocket.remote_address)
+        return False
+    return True
+
+def validate_challenge(websocket, message_type, payload, target_id):
+    """Type 5 (Challenge)."""
+    return (is_valid_string(target_id)
+            and is_valid_base64_like(payload.get("iv"), 32) # IV is short
+            and is_valid_base64_like(payload.get("encryptedChallenge")))
+
+def validate_challenge_response(websocket, message_type, payload, target_id):
+    """Type 6 (Challenge Response)."""
+    return (is_valid_string(target_id)
+            and is_valid_base64_like(payload.get("iv"), 32)
+            and is_valid_base64_like(payload.get("encryptedResponse")))
+
+def validate_encrypted_message(websocket, message_type, payload, target_id):
+    """Type 8 (Encrypted Message)."""
+    return (is_valid_string(target_id)
+            and is_valid_base64_like(payload.get("iv"), 32)
+            and is_valid_base64_like(payload.get("data"))) # Check 'data' field
+
+def validate_file_request(websocket, message_type, payload, target_id):
+    """Type 12 (FILE_TRANSFER_REQUEST)."""
+    file_size = payload.get("fileSize")
+    return (is_valid_string(target_id)
+            and is_valid_string(payload.get("transferId"), 64) # UUID length + buffer
+            and is_valid_string(payload.get("fileName"), 255) # Max filename length
+            and isinstance(file_size, int) and file_size >= 0 # Must be non-negative integer
+            and is_valid_string(payload.get("fileType"), 100)) # MIME type length
+
+def validate_file_transfer_id(websocket, message_type, payload, target_id):
+    """Types 13, 14, 16 (FILE_TRANSFER_ACCEPT / REJECT / COMPLETE)."""
+    return (is_valid_string(target_id)
+            and is_valid_string(payload.get("transferId"), 64))
+
+def validate_file_chunk(websocket, message_type, payload, target_id):
+    """Type 15 (FILE_CHUNK)."""
+    chunk_index = payload.get("chunkIndex")
+    if not (is_valid_string(target_id)
+            and is_valid_string(payload.get("transferId"), 64)
+            and isinstance(chunk_index, int) and chunk_index >= 0
+            and is_valid_base64_like(payload.get("iv"), 32)):
+        return False
+    # Check only for presence, string type and non-empty. The chunk body is relayed verbatim
+    # and only ever decoded by the receiving client, so it is not scanned character by character
+    # here (that scan dominated the cost of relaying large chunks).
+    # Length is handled by the WebSocket max_size setting.
+    chunk_data = payload.get("data")
+    if not isinstance(chunk_data, str) or len(chunk_data) == 0:
+        logger.warning("Invalid 'data' field (type or empty) in Type 15 payload from %s. Ignoring.", websocket.remote_address)
+        return False
+    return True
+
+def validate_file_error(websocket, message_type, payload, target_id):
+    """Type 17 (FILE_TRANSFER_ERROR): error message is optional but must be a string if present."""
+    return (is_valid_string(target_id)
+            and is_valid_string(payload.get("transferId"), 64)
+            and not ("error" in payload and not isinstance(payload.get("error"), str)))
+
+# PAYLOAD_VALIDATORS: Maps each accepted message type to its validator (O(1) dispatch per message).
+PAYLOAD_VALIDATORS = {
+    0: validate_registration,
+    1: validate_target_only, 3: validate_target_only, 7: validate_target_only, 7.1: validate_target_only,
+    9: validate_target_only, 10: validate_target_only, 11: validate_target_only,
+    2: validate_public_key, 4: validate_public_key,
+    5: validate_challenge,
+    6: validate_challenge_response,
+    8: validate_encrypted_message,
+    12: validate_file_request,
+    13: validate_file_transfer_id, 14: validate_file_transfer_id, 16: validate_file_transfer_id,
+    15: validate_file_chunk,
+    17: validate_file_error,
+}
 
 
 # --- Main Connection Handler ---
@@ -202,223 +515,124 @@ async def connection_handler(websocket):
     Args:
         websocket: The websockets.WebSocketServerProtocol object representing the connected client.
     """
-    client_ip = websocket.remote_address[0] # Get IP address (index 0 of the tuple)
+    # Read the peer address once: remote_address queries the transport on every access (and is None after close).
+    client_address = websocket.remote_address
+    client_ip = client_address[0] # Get IP address (index 0 of the tuple)
     # Log connection attempt (important event, not wrapped).
-    logging.info(f"Client attempting connection from {client_ip}:{websocket.remote_address[1]}")
+    logger.info("Client attempting connection from %s:%s", client_ip, client_address[1])
 
     # --- Connection Rate Limiting ---
-    current_time = time.time()
-    # Get the list of recent connection timestamps for this IP, default to empty list if none.
-    connection_times = CONNECTION_ATTEMPTS.get(client_ip, [])
-    # Filter out timestamps older than the defined window.
-    valid_attempts = [t for t in connection_times if current_time - t < config.CONNECTION_WINDOW_SECONDS]
-    # Check if the number of valid recent attempts exceeds the limit.
-    if len(valid_attempts) >= config.MAX_CONNECTIONS_PER_IP:
+    current_time = time.monotonic()
+    # Get this IP's bucket, creating a full one on its first connection attempt.
+    connection_bucket = CONNECTION_ATTEMPTS.get(client_ip)
+    if connection_bucket is None:
+        connection_bucket = CONNECTION_ATTEMPTS[client_ip] = TokenBucket(current_time, config.MAX_CONNECTIONS_PER_IP)
+    # Check (and count) this attempt against the rate limit.
+    if not connection_bucket.allow(current_time, config.CONNECTION_WINDOW_SECONDS, config.MAX_CONNECTIONS_PER_IP):
         # Always log rate limit warnings.
-        logging.warning(f"Connection rate limit exceeded for IP {client_ip}. Closing connection.")
+        logger.warning("Connection rate limit exceeded for IP %s. Closing connection.", client_ip)
         # Close the connection immediately with a specific code (e.g., 1008 Policy Violation).
         await websocket.close(code=1008, reason="Connection rate limit exceeded")
-        # Update the list in the dictionary (optional, helps keep it trimmed)
-        CONNECTION_ATTEMPTS[client_ip] = valid_attempts
         return # Exit the handler, preventing further processing for this connection.
     else:
-        # If limit not exceeded, add the current timestamp and update the dictionary.
-        valid_attempts.append(current_time)
-        CONNECTION_ATTEMPTS[client_ip] = valid_attempts
         # Log connection acceptance (important event, not wrapped).
-        logging.info(f"Connection accepted from {client_ip}:{websocket.remote_address[1]}")
-        # Initialize message timestamp tracking for this new connection
-        MESSAGE_TIMESTAMPS[websocket] = []
-
+        logger.info("Connection accepted from %s:%s", client_ip, client_address[1])
+        # Initialize message rate limit tracking for this new connection (freed with the handler).
+        message_bucket = TokenBucket(current_time, config.MAX_MESSAGES_PER_CONNECTION)
+        # asyncio enables TCP_NODELAY on every connection; only touch the socket if it is disabled in the config.
+        if not config.TCP_NODELAY:
+            client_socket = websocket.transport.get_extra_info('socket')
+            if client_socket is not None: client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+
+    sender_id = None # This connection's registered identifier; only changes when it registers.
+    last_error_type, last_error_time = None, 0.0 # Last unexpected per-message error (traceback de-duplication)
     try:
         # --- Message Receiving Loop ---
         # Continuously listen for messages from this client.
         # The loop breaks automatically if the connection is closed.
         async for message in websocket:
-            current_time = time.time() # Get time for message rate limiting
-
             # --- Message Rate Limiting ---
-            message_times = MESSAGE_TIMESTAMPS.get(websocket, [])
-            # Filter out old message timestamps.
-            valid_message_times = [t for t in message_times if current_time - t < config.MESSAGE_WINDOW_SECONDS]
-            # Check if the limit is exceeded.
-            if len(valid_message_times) >= config.MAX_MESSAGES_PER_CONNECTION:
+            # Check (and count) this message against the rate limit.
+            if not message_bucket.allow(time.monotonic(), config.MESSAGE_WINDOW_SECONDS, config.MAX_MESSAGES_PER_CONNECTION):
                 # Always log rate limit warnings.
-                logging.warning(f"Message rate limit exceeded for {websocket.remote_address} ({CONNECTIONS.get(websocket, 'Unregistered')}). Sending notification and closing connection.")
+                logger.warning("Message rate limit exceeded for %s (%s). Sending notification and closing connection.", client_address, sender_id or 'Unregistered')
                 # Send Type -2 error message to the client before closing.
                 error_payload = {"error": "Message rate limit exceeded. Disconnecting."}
                 await send_json(websocket, -2, error_payload)
                 # Now close the connection.
                 await websocket.close(code=1008, reason="Message rate limit exceeded")
                 break # Exit the message loop.
-            else:
-                # If limit not exceeded, add current timestamp.
-                valid_message_times.append(current_time)
-                MESSAGE_TIMESTAMPS[websocket] = valid_message_times
 
             # Log the raw message received only if DEBUG is enabled.
-            if config.DEBUG:
-                logging.info(f"Raw message received from {websocket.remote_address} ({CONNECTIONS.get(websocket, 'Unregistered')}): {message}")
+            if DEBUG:
+                logger.info("Raw message received from %s (%s): %s", client_address, sender_id or 'Unregistered', message)
 
             try:
                 # --- Message Parsing and Stricter Validation ---
                 data = None # Initialize data to None
+                message_type = None # Not known until the message has been parsed (used in error logs)
                 try:
-                    data = json.loads(message)
+                    data = json_loads(message)
                 except json.JSONDecodeError:
                     # Always log JSON errors as warnings.
-                    logging.warning(f"Invalid JSON received from {websocket.remote_address}. Ignoring.")
+                    logger.warning("Invalid JSON received from %s. Ignoring.", client_address)
                     continue # Skip to the next message
 
                 # Basic structure validation
                 if not isinstance(data, dict):
                     # Always log structure errors as warnings.
-                    logging.warning(f"Received non-dictionary data from {websocket.remote_address}. Ignoring: {data}")
+                    logger.warning("Received non-dictionary data from %s. Ignoring: %s", client_address, data)
                     continue
+                # Look up the validator for this message type first, so missing, non-numeric and unknown
+                # types are all rejected with a single dict lookup before the payload is examined.
+                # (Accepted types are exactly the PAYLOAD_VALIDATORS keys, all numbers.)
                 message_type = data.get("type")
-                payload = data.get("payload")
-                if message_type is None or payload is None:
-                    # Always log structure errors as warnings.
-                    logging.warning(f"Missing 'type' or 'payload' in message from {websocket.remote_address}. Ignoring: {data}")
-                    continue
-                if not isinstance(message_type, (int, float)): # Allow numeric types
+                try:
+                    validator = PAYLOAD_VALIDATORS.get(message_type)
+                except TypeError: # Unhashable 'type' value (e.g. a list or object).
+                    validator = None
+                if validator is None:
                     # Always log type errors as warnings.
-                    logging.warning(f"Invalid 'type' (not a number) in message from {websocket.remote_address}. Ignoring: {data}")
+                    logger.warning("Missing, invalid or unknown 'type' in message from %s. Ignoring: %s", client_address, data)
                     continue
+                payload = data.get("payload")
                 if not isinstance(payload, dict):
                      # Always log payload type errors as warnings.
-                     logging.warning(f"Invalid 'payload' (not a dictionary) in message from {websocket.remote_address}. Ignoring: {data}")
+                     logger.warning("Missing or invalid 'payload' (not a dictionary) in message from %s. Ignoring: %s", client_address, data)
                      continue
 
-                # Type-specific payload validation
-                validation_passed = True
-                sender_id = CONNECTIONS.get(websocket) # Get sender ID if registered
-                target_id = payload.get("targetId") if isinstance(payload, dict) else None
-
-                # --- Helper for common string validation ---
-                def is_valid_string(value, max_len=50):
-                    return isinstance(value, str) and 0 < len(value.strip()) <= max_len
-
-                # --- Helper for common Base64-like string validation (basic check) ---
-                def is_valid_base64_like(value, max_len=1024*128): # Default max length from Session.js
-                    # Basic check: is string, not empty, within length limit, contains only valid chars
-                    # This is NOT a full Base64 validation but catches many obvious errors.
-                    # Use BASE64_CHARS_REGEX defined globally
-                    return isinstance(value, str) and 0 < len(value) <= max_len and BASE64_CHARS_REGEX.match(value)
+                # --- Sender Check (all relayed types) ---
+                # A registered client must always name itself as 'senderId'. Type 0 carries no senderId;
+                # a repeat registration is answered by handle_registration instead.
+                if sender_id and message_type != 0 and payload.get("senderId") != sender_id:
+                    logger.warning("Mismatched 'senderId' in Type %s from registered client %s. Ignoring.", message_type, sender_id)
+                    continue
 
                 # --- Message Type Specific Validation ---
-                if message_type == 0: # Registration
-                    identifier = payload.get("identifier")
-                    if not is_valid_string(identifier, 30) or not VALID_IDENTIFIER_REGEX.match(identifier):
-                        logging.warning(f"Invalid identifier format/type in Type 0 payload from {websocket.remote_address}. Ignoring: {payload}")
-                        # Error is sent back by handle_registration if format is invalid
-                        validation_passed = False
+                target_id = payload.get("targetId")
+                if not validator(websocket, message_type, payload, target_id):
+                    if message_type == 0:
                         # Send error back immediately if basic type/length is wrong before regex check
+                        identifier = payload.get("identifier")
                         if not isinstance(identifier, str) or len(identifier) == 0 or len(identifier) > 30:
                              await send_json(websocket, 0.2, {"identifier": identifier, "error": "Identifier must be a non-empty string (max 30 chars)."})
-
-                elif message_type in [1, 3, 7, 9, 10, 11]: # Simple target/sender types
-                    if not is_valid_string(target_id):
-                        logging.warning(f"Invalid 'targetId' in Type {message_type} payload from {websocket.remote_address}. Ignoring: {payload}")
-                        validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id:
-                        logging.warning(f"Mismatched 'senderId' in Type {message_type} from registered client {sender_id}. Ignoring: {payload}")
-                        validation_passed = False
-
-                # --- NEW: Add validation for Type 7.1 (SAS Confirm) ---
-                elif message_type == 7.1: # SAS Confirmation
-                    if not is_valid_string(target_id):
-                        logging.warning(f"Invalid 'targetId' in Type 7.1 payload from {websocket.remote_address}. Ignoring: {payload}")
-                        validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id:
-                        logging.warning(f"Mismatched 'senderId' in Type 7.1 from registered client {sender_id}. Ignoring: {payload}")
-                        validation_passed = False
-                # --- END NEW ---
-
-                elif message_type in [2, 4]: # Public Key types
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("publicKey"), 512): # Check publicKey (SPKI format is relatively short)
-                        logging.warning(f"Invalid 'publicKey' in Type {message_type} payload from {websocket.remote_address}. Ignoring.")
-                        validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-
-                elif message_type == 5: # Challenge
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("iv"), 32): validation_passed = False # IV is short
-                    elif not is_valid_base64_like(payload.get("encryptedChallenge")): validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type 5 payload from {websocket.remote_address}. Ignoring.")
-
-                elif message_type == 6: # Challenge Response
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("iv"), 32): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("encryptedResponse")): validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type 6 payload from {websocket.remote_address}. Ignoring.")
-
-                elif message_type == 8: # Encrypted Message
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("iv"), 32): validation_passed = False
-                    elif not is_valid_base64_like(payload.get("data")): validation_passed = False # Check 'data' field
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type 8 payload from {websocket.remote_address}. Ignoring.")
-
-                # File Transfer Validation
-                elif message_type == 12: # FILE_TRANSFER_REQUEST
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_string(payload.get("transferId"), 64): validation_passed = False # UUID length + buffer
-                    elif not is_valid_string(payload.get("fileName"), 255): validation_passed = False # Max filename length
-                    elif not isinstance(payload.get("fileSize"), int) or payload.get("fileSize") < 0: validation_passed = False # Must be non-negative integer
-                    elif not is_valid_string(payload.get("fileType"), 100): validation_passed = False # MIME type length
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type 12 payload from {websocket.remote_address}. Ignoring.")
-
-                elif message_type in [13, 14, 16]: # FILE_TRANSFER_ACCEPT / REJECT / COMPLETE
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_string(payload.get("transferId"), 64): validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type {message_type} payload from {websocket.remote_address}. Ignoring.")
-
-                elif message_type == 15: # FILE_CHUNK
-                    chunk_data = payload.get("data") # Get the data field
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_string(payload.get("transferId"), 64): validation_passed = False
-                    elif not isinstance(payload.get("chunkIndex"), int) or payload.get("chunkIndex") < 0: validation_passed = False
-                    elif not is_valid_base64_like(payload.get("iv"), 32): validation_passed = False
-                    # Check only for presence, string type, non-empty, and valid Base64 characters.
-                    # Length is handled by the WebSocket max_size setting.
-                    elif not isinstance(chunk_data, str) or len(chunk_data) == 0 or not BASE64_CHARS_REGEX.match(chunk_data):
-                        logging.warning(f"Invalid 'data' field (type, empty, or invalid chars) in Type 15 payload from {websocket.remote_address}. Ignoring.")
-                        validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-
-                elif message_type == 17: # FILE_TRANSFER_ERROR
-                    if not is_valid_string(target_id): validation_passed = False
-                    elif not is_valid_string(payload.get("transferId"), 64): validation_passed = False
-                    # Error message is optional but should be string if present
-                    elif "error" in payload and not isinstance(payload.get("error"), str): validation_passed = False
-                    elif sender_id and payload.get("senderId") != sender_id: validation_passed = False
-                    if not validation_passed: logging.warning(f"Invalid Type 17 payload from {websocket.remote_address}. Ignoring.")
-                # --- End File Transfer Validation ---
-
-                if not validation_passed:
-                    # Log the specific failure reason if not already logged above
-                    if message_type not in [0, 5, 6, 8, 12, 15, 17]: # Avoid double logging for types with internal logs
-                         logging.warning(f"Invalid Type {message_type} payload from {websocket.remote_address}. Ignoring.")
+                    else:
+                        logger.warning("Invalid Type %s payload from %s. Ignoring.", message_type, client_address)
                     continue # Skip processing this invalid message
 
                 # --- Message Routing (Post-Validation) ---
                 if message_type == 0: # Registration Request
                     # Call the registration handler (identifier already validated above)
                     await handle_registration(websocket, payload["identifier"])
+                    sender_id = CONNECTIONS.get(websocket) # Set if the registration succeeded
                 # --- Message Relaying (for registered clients) ---
                 elif sender_id: # Check if the sender is registered.
                     # Target ID already extracted and validated above.
                     # Log relay attempt only if DEBUG is enabled.
-                    if config.DEBUG:
+                    if DEBUG:
                         # Avoid logging full chunk data in debug mode for performance/readability
                         log_payload = payload if message_type != 15 else {**payload, "data": f"<Chunk {payload.get('chunkIndex', '?')} Data Omitted>"}
-                        logging.info(f"Attempting to relay message type {message_type} from '{sender_id}' to '{target_id}': {log_payload}")
+                        logger.info("Attempting to relay message type %s from '%s' to '%s': %s", message_type, sender_id, target_id, log_payload)
                     # Look up the target client's WebSocket connection using their ID.
                     target_websocket = CLIENTS.get(target_id)
 
@@ -426,8 +640,8 @@ async def connection_handler(websocket):
                     if target_websocket: # Check if the target client is currently connected and registered.
                         try:
                             # Log successful relay only if DEBUG is enabled.
-                            if config.DEBUG:
-                                logging.info(f"Relaying message to {target_id} ({target_websocket.remote_address})")
+                            if DEBUG:
+                                logger.info("Relaying message to %s (%s)", target_id, target_websocket.remote_address)
                             # Send the original, validated JSON message string to the target client.
                             await target_websocket.send(message)
 
@@ -435,81 +649,118 @@ async def connection_handler(websocket):
                             # If a Type 2 (Accept) is successfully relayed, record the session.
                             if message_type == 2:
                                 # Log session recording only if DEBUG is enabled.
-                                if config.DEBUG:
-                                    logging.info(f"Recording active session between {sender_id} and {target_id}")
-                                ACTIVE_SESSIONS[sender_id] = target_id
-                                ACTIVE_SESSIONS[target_id] = sender_id # Record the reverse mapping too
+                                if DEBUG:
+                                    logger.info("Recording active session between %s and %s", sender_id, target_id)
+                                link_session(sender_id, target_id) # Records both directions
 
                             # If a Type 9 (End Session) is successfully relayed, clear the session.
                             elif message_type == 9:
                                 # Log session clearing only if DEBUG is enabled.
-                                if config.DEBUG:
-                                    logging.info(f"Clearing active session between {sender_id} and {target_id} due to Type 9 message relay.")
-                                if sender_id in ACTIVE_SESSIONS:
-                                    # Check if the stored peer matches the target before deleting
-                                    if ACTIVE_SESSIONS[sender_id] == target_id:
-                                        del ACTIVE_SESSIONS[sender_id]
-                                if target_id in ACTIVE_SESSIONS:
-                                     # Check if the stored peer matches the sender before deleting
-                                    if ACTIVE_SESSIONS[target_id] == sender_id:
-                                        del ACTIVE_SESSIONS[target_id]
+                                if DEBUG:
+                                    logger.info("Clearing active session between %s and %s due to Type 9 message relay.", sender_id, target_id)
+                                # Only clears the entries if they still refer to this pair.
+                                if not unlink_session(sender_id, target_id): unlink_session(target_id, sender_id)
                             # --- END Session Tracking Update ---
 
                         except websockets.exceptions.ConnectionClosed:
                             # Handle the case where the target client disconnected *during* the send attempt.
                             # Always log this warning.
-                            logging.warning(f"Relay failed: Target user '{target_id}' connection closed during send attempt.")
+                            logger.warning("Relay failed: Target user '%s' connection closed during send attempt.", target_id)
                             # Send standardized error message (Type -1) back to the original sender.
-                            error_payload = {"targetId": target_id, "message": f"User '{target_id}' is unavailable."} # Standardized message
-                            await send_json(websocket, -1, error_payload)
+                            await send_user_unavailable(websocket, target_id)
                         except Exception as e:
                              # Catch any other unexpected errors during the relay send.
                              # Always log unexpected exceptions.
-                             logging.exception(f"Unexpected error relaying message to {target_id}")
+                             logger.exception("Unexpected error relaying message to %s", target_id)
                              # Consider sending an error back to the sender here as well, if appropriate.
                     else:
                         # Target client ID not found in the CLIENTS registry (not online or never registered).
                         # Always log this warning.
-                        logging.warning(f"Target user '{target_id}' not found. Sending error back to '{sender_id}'.")
+                        logger.warning("Target user '%s' not found. Sending error back to '%s'.", target_id, sender_id)
                         # Send standardized error message (Type -1) back to the original sender.
-                        error_payload = {"targetId": target_id, "message": f"User '{target_id}' is unavailable."} # Standardized message
-                        await send_json(websocket, -1, error_payload)
+                        await send_user_unavailable(websocket, target_id)
                 else:
                     # Received a non-registration message from a client that hasn't registered yet.
                     # Always log this warning.
-                    logging.warning(f"Received non-registration message type {message_type} from unregistered client {websocket.remote_address}. Ignoring.")
+                    logger.warning("Received non-registration message type %s from unregistered client %s. Ignoring.", message_type, client_address)
 
             except Exception as e:
-                # Catch any other errors that occur during the processing of a single message
-                # (e.g., unexpected payload structure, errors in handlers).
-                # Always log unexpected exceptions.
-                logging.exception(f"Error processing message from {websocket.remote_address} ({CONNECTIONS.get(websocket, 'Unregistered')}): {message}")
+                # Catch any errors that occur during the processing of a single message, and keep the connection.
+                # This includes KeyError/ValueError/TypeError: usually a payload shape the validators did not
+                # anticipate, but just as likely a bug in a handler, so they get a traceback like everything else.
+                # Log the traceback once; the same error type repeating on this connection within
+                # ERROR_LOG_REPEAT_SECONDS is logged as a one-line warning, so one client cannot flood the log.
+                error_time = time.monotonic()
+                if type(e) is last_error_type and error_time - last_error_time < ERROR_LOG_REPEAT_SECONDS:
+                    logger.warning("Repeated %s processing message from %s (%s): %s", type(e).__name__, client_address, sender_id or 'Unregistered', e)
+                else:
+                    logger.exception("Error processing message from %s (%s): %s", client_address, sender_id or 'Unregistered', message)
+                    last_error_type = type(e)
+                last_error_time = error_time
                 # Consider sending a generic error back to the client if appropriate.
 
     # --- Connection Closed Handling ---
-    except websockets.exceptions.ConnectionClosedOK:
-        # Log when a client disconnects cleanly (important event, not wrapped).
-        logging.info(f"Client {websocket.remote_address} disconnected gracefully.")
-    except websockets.exceptions.ConnectionClosedError as e:
-        # Log when a client disconnects due to an error (important event, not wrapped).
-        logging.info(f"Client {websocket.remote_address} disconnected with error: {e}")
+    except websockets.exceptions.ConnectionClosed as e:
+        # Client disconnected, cleanly (ConnectionClosedOK) or with an error (ConnectionClosedError).
+        # Log it either way (important event, not wrapped).
+        logger.info("Client %s disconnected: %s", client_address, e)
     except Exception as e:
         # Catch any unexpected errors in the main connection handling loop itself
         # (outside the message processing loop).
         # Always log unexpected exceptions.
-        logging.exception(f"An unexpected error occurred handling client {websocket.remote_address}")
+        logger.exception("An unexpected error occurred handling client %s", client_address)
     finally:
         # --- Cleanup ---
-        # Remove message rate limiting data for this connection
-        if websocket in MESSAGE_TIMESTAMPS:
-            del MESSAGE_TIMESTAMPS[websocket]
-            # Log cleanup only if DEBUG is enabled.
-            if config.DEBUG:
-                logging.info(f"Removed message timestamp tracking for {websocket.remote_address}")
+        # (The message rate limit bucket is a local and goes away with this handler.)
         # Ensure the client is unregistered from the global registries AND handle disconnect notification.
-        unregister_client(websocket) # This now includes the notification logic
+        await unregister_client(websocket) # This now includes the notification logic
         # Log connection closed (important event, not wrapped).
-        logging.info(f"Connection closed for {websocket.remote_address}")
+        logger.info("Connection closed for %s", client_address)
+
+
+# --- SSL Context ---
+@lru_cache(maxsize=4)
+def _build_ssl_context(cert_file, key_file, cert_mtime_ns, key_mtime_ns):
+    """
+    Creates the server SSL context and loads the certificate chain.
+    Cached per (paths, modification times): the PEM files are only parsed again if they change on disk.
+
+    Args:
+        cert_file (str): Path to the certificate (chain) file.
+        key_file (str): Path to the private key file.
+        cert_mtime_ns (int): Modification time of cert_file (cache key only).
+        key_mtime_ns (int): Modification time of key_file (cache key only).
+
+    Returns:
+        ssl.SSLContext: The configured server context.
+    """
+    # Create an SSL context for a TLS server.
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2 # Refuse TLS 1.0 / 1.1.
+    # TLS 1.2 suites: forward-secret AEAD only (TLS 1.3 suites are always AEAD and not affected by this).
+    ssl_context.set_ciphers('ECDHE+AESGCM:ECDHE+CHACHA20')
+    # Session resumption: keep stateless tickets enabled so reconnecting clients skip the full handshake.
+    if config.TLS_SESSION_TICKETS:
+        ssl_context.options &= ~ssl.OP_NO_TICKET
+    else:
+        ssl_context.options |= ssl.OP_NO_TICKET
+    if hasattr(ssl_context, 'num_tickets'): # Python 3.8+ (TLS 1.3 tickets per handshake).
+        ssl_context.num_tickets = config.TLS_SESSION_TICKETS
+    # Load the certificate chain (cert file) and private key (key file).
+    # These files must exist and be valid for WSS to work.
+    ssl_context.load_cert_chain(cert_file, key_file)
+    return ssl_context
+
+def get_ssl_context():
+    """
+    Returns the (cached) SSL context for the configured CERT_FILE / KEY_FILE.
+
+    Raises:
+        FileNotFoundError: If either file does not exist.
+        ssl.SSLError / OSError: If the files cannot be loaded.
+    """
+    return _build_ssl_context(config.CERT_FILE, config.KEY_FILE,
+                              os.stat(config.CERT_FILE).st_mtime_ns, os.stat(config.KEY_FILE).st_mtime_ns)
 
 
 # --- Server Startup Function ---
@@ -527,42 +778,37 @@ async def start_server(host, port):
     protocol = "ws" # Default protocol is unencrypted WebSocket.
 
     # Check if SSL is enabled in the configuration.
-    if config.ENABLE_SSL:
+    if config.ENABLE_SSL and not config.SSL_READY:
+        # The certificate files were already found to be missing when config.py was imported.
+        logger.error("SSL Error: Certificate or Key file not found. Disabling SSL.")
+    elif config.ENABLE_SSL:
         try:
             # Log the paths being used for certificate and key files.
-            logging.info(f"Attempting to load SSL cert: {config.CERT_FILE}")
-            logging.info(f"Attempting to load SSL key: {config.KEY_FILE}")
-            # Create an SSL context for a TLS server.
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            # Load the certificate chain (cert file) and private key (key file).
-            # These files must exist and be valid for WSS to work.
-            ssl_context.load_cert_chain(config.CERT_FILE, config.KEY_FILE)
+            logger.info("Attempting to load SSL cert: %s", config.CERT_FILE)
+            logger.info("Attempting to load SSL key: %s", config.KEY_FILE)
+            # Build (or reuse) the SSL context for the certificate and key.
+            ssl_context = get_ssl_context()
             protocol = "wss" # Update protocol string if SSL is successfully loaded.
-            logging.info("SSL context created successfully.")
+            logger.info("SSL context created successfully.")
         except FileNotFoundError:
             # Handle error if certificate or key file is not found at the specified path.
-            logging.error("SSL Error: Certificate or Key file not found. Disabling SSL.")
+            logger.error("SSL Error: Certificate or Key file not found. Disabling SSL.")
             ssl_context = None # Ensure ssl_context is None to fall back to WS.
         except Exception as e:
             # Handle any other errors during SSL context creation or loading (e.g., invalid format, permissions).
-            logging.exception("SSL Error: Failed to create SSL context. Disabling SSL.")
+            logger.exception("SSL Error: Failed to create SSL context. Disabling SSL.")
             ssl_context = None # Ensure ssl_context is None to fall back to WS.
 
     # Determine the effective protocol based on whether SSL context was successfully created.
     effective_protocol = "wss" if ssl_context else "ws"
     # Log essential startup info.
-    logging.info(f"Starting server on {effective_protocol}://{host}:{port}")
-    logging.info(f"Connection Rate Limit: {config.MAX_CONNECTIONS_PER_IP} per {config.CONNECTION_WINDOW_SECONDS}s per IP")
-    logging.info(f"Message Rate Limit: {config.MAX_MESSAGES_PER_CONNECTION} per {config.MESSAGE_WINDOW_SECONDS}s per Connection")
-
-    # Define the maximum message size (e.g., 1MB = 1024 * 1024 bytes)
-    # This value could potentially be moved to config.py if desired
-    # Increase max size slightly to accommodate chunk overhead (IV, index, etc.) + chunk size
-    # Example: 256KB chunk + ~1KB overhead -> ~257KB. Let's set to 512KB for buffer.
-    MAX_MESSAGE_SIZE = 512 * 1024 # Adjust as needed based on CHUNK_SIZE + overhead
-    logging.info(f"Maximum WebSocket message size: {MAX_MESSAGE_SIZE} bytes") # Log the max size being used
+    # (%-style arguments: logging only builds the string if the record is actually emitted.)
+    logger.info("Starting server on %s://%s:%s", effective_protocol, host, port)
+    logger.info("Connection Rate Limit: %s per %ss per IP", config.MAX_CONNECTIONS_PER_IP, config.CONNECTION_WINDOW_SECONDS)
+    logger.info("Message Rate Limit: %s per %ss per Connection", config.MAX_MESSAGES_PER_CONNECTION, config.MESSAGE_WINDOW_SECONDS)
+    logger.info("Maximum WebSocket message size: %d bytes", MAX_MESSAGE_SIZE) # Log the max size being used
     # Log debug status
-    logging.info(f"Server Debug Logging: {'ENABLED' if config.DEBUG else 'DISABLED'}")
+    logger.info("Server Debug Logging: %s", 'ENABLED' if DEBUG else 'DISABLED')
 
 
     try:
@@ -572,22 +818,50 @@ async def start_server(host, port):
         # - port: The port number to listen on.
         # - ssl: Pass the created SSL context here if using WSS, otherwise None for WS.
         # - max_size: Set the maximum allowed size for incoming messages in bytes.
+        # - reuse_port / backlog: Listening socket options from config.py (passed through to asyncio).
+        # - compression=None: Disable permessage-deflate. Relayed payloads are AES-GCM ciphertext (incompressible),
+        #   so deflating every frame only burns CPU.
+        # - max_queue / write_limit / ping_*: Per-connection buffering and keepalive settings from config.py.
+        #   (read_limit is only accepted by the legacy websockets API, so it is not passed here.)
         async with websockets.serve(
             connection_handler,
             host,
             port,
             ssl=ssl_context, # Pass the context (or None)
-            max_size=MAX_MESSAGE_SIZE # Add the max_size parameter
+            max_size=MAX_MESSAGE_SIZE, # From config.py
+            reuse_port=config.SO_REUSEPORT or None, # None = asyncio default (not set)
+            backlog=config.SOCKET_BACKLOG,
+            compression=None, # Payloads are encrypted; compression gains nothing
+            max_queue=config.WS_MAX_QUEUE,
+            write_limit=config.WS_WRITE_LIMIT,
+            ping_interval=config.WS_PING_INTERVAL,
+            ping_timeout=config.WS_PING_TIMEOUT
         ) as server_instance:
-            # Keep the server running indefinitely by awaiting a Future that never completes.
-            # The server will run until the process is interrupted (e.g., Ctrl+C).
-            await asyncio.Future()
+            # Start the background sweep that keeps CONNECTION_ATTEMPTS from growing with every IP ever seen.
+            sweep_task = asyncio.create_task(sweep_connection_attempts())
+            # Run until SIGINT (Ctrl+C) or SIGTERM (e.g., sent by helix_manager.py) sets shutdown_event.
+            # Leaving the 'async with' block then closes the listening socket and all client connections.
+            shutdown_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            handled_signals = []
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, shutdown_event.set)
+                    handled_signals.append(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass # Not supported (e.g., Windows): Ctrl+C still raises KeyboardInterrupt as before.
+            try:
+                await shutdown_event.wait()
+                logger.info("Shutdown signal received. Closing server...")
+            finally:
+                sweep_task.cancel()
+                for sig in handled_signals: loop.remove_signal_handler(sig)
     except OSError as e:
         # Catch common OS-level errors during server startup.
-        logging.exception(f"OSError starting server on {host}:{port}")
+        logger.exception("OSError starting server on %s:%s", host, port)
     except Exception as e:
         # Catch any other unexpected errors during server startup or runtime.
-        logging.exception(f"Error occurred during websockets.serve or server runtime ({effective_protocol})")
+        logger.exception("Error occurred during websockets.serve or server runtime (%s)", effective_protocol)
         raise # Re-raise the exception to potentially be caught by main.py
 
 # Note: The actual execution start (asyncio.run) is handled in main.py
\ No newline at end of file